@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+#########################################
+# File: bench.py
+# Benchmarks of the bin/ tools on the synthetic data of generators.py.
+#   bench.py run [-b maps pairsqc ...] [-s small medium] [-o results.json]
+#   bench.py compare base.json new.json [--threshold 0.1]
+# Every benchmark runs its tool in a subprocess, with --profile if it has it, and records
+# the wall time, the peak RSS of the process and its children, the throughput
+# (items of the benchmark per second) and the stages of the profile, as the
+# best of --repeat runs. The results are saved as JSON with the commit and the
+# machine, so two runs can be compared across commits. Everything runs offline.
+# This source code is licensed under the MIT license
+#########################################
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import subprocess
+import generators
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(REPO_DIR, "bin")
+
+
+def accepts(bin_dir, script, option):
+    # whether the script of bin_dir has the option, the older revisions of the tools lacking some;
+    # --profile is added by profiling.add_argument
+    with open(os.path.join(bin_dir, script)) as f:
+        text = f.read()
+    return '"%s"' % option in text or (option == "--profile" and "profiling.add_argument(" in text)
+
+
+def restriction_cut(data, workdir, cores, bin_dir=BIN_DIR):
+    out = os.path.join(workdir, "genome.cut")
+    cmd = ["restriction_cut_multipleenzyme.py", "-f", data["fasta"], "-s", "GATC", "-p", "0", "-o", out]
+    return cmd + ["-c", str(cores)], out, data["bases"]
+
+
+def feature_frag2bin(data, workdir, cores, bin_dir=BIN_DIR):
+    out = os.path.join(workdir, "bench.features.txt")
+    cmd = ["feature_frag2bin.py", "-i", data["fragments"], "-b", "5Kb", "-g", data["chrom_sizes"], "-o", out]
+    return cmd, out, data["count"]
+
+
+def maps(data, workdir, cores, bin_dir=BIN_DIR):
+    # the generated run file, with the output in the work folder
+    run_file = os.path.join(workdir, "bench.maps.run")
+    with open(data["run_file"]) as f, open(run_file, "w") as out:
+        for line in f:
+            out.write("OUT_DIR=%s/\n" % workdir if line.startswith("OUT_DIR=") else line)
+    return ["MAPS.py", run_file, "long.bedpe", "shrt.vip.bed"], os.path.join(workdir, "bench.maps"), data["long_pairs"]
+
+
+def pairsqc(data, workdir, cores, bin_dir=BIN_DIR):
+    prefix = os.path.join(workdir, "bench")
+    cmd = ["pairsqc.py", "-p", data["pairs"], "-c", data["chrom_sizes"], "-t", "P", "-O", prefix, "-s", "bench"]
+    return cmd, os.path.join(prefix + "_report", "bench"), data["count"]
+
+
+def peakachu(data, workdir, cores, bin_dir=BIN_DIR):
+    out = os.path.join(workdir, "bench.loops.bedpe")
+    cmd = ["peakachu_score_genome.py", "-r", "10000", "-p", data["cool"], "-m", data["model"], "-O", out]
+    if accepts(bin_dir, cmd[0], "--threads"):
+        cmd += ["-t", str(cores)]
+    return cmd, out, data["pixels"]
+
+
+# benchmark: (data generator, command builder, unit of the throughput)
+BENCHMARKS = {
+    "restriction_cut": ("fasta", restriction_cut, "bases"),
+    "feature_frag2bin": ("fragments", feature_frag2bin, "fragments"),
+    "maps": ("maps", maps, "long pixels"),
+    "pairsqc": ("pairs", pairsqc, "pairs"),
+    "peakachu": ("cooler", peakachu, "pixels"),
+}
+
+
+def run_tool(cmd, workdir, bin_dir=BIN_DIR):
+    # run a tool of bin_dir, return its wall time and the peak RSS in Mb of the process
+    # and the children it waited for
+    env = dict(os.environ, PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""))
+    env.pop("HICAR_PROFILE", None)
+    cmd = [sys.executable, os.path.join(bin_dir, cmd[0])] + cmd[1:]
+    start = time.time()
+    with open(os.path.join(workdir, "log.txt"), "w") as log:
+        proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.time() - start
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+        with open(os.path.join(workdir, "log.txt")) as log:
+            raise RuntimeError("%s failed:\n%s" % (" ".join(cmd), log.read()[-2000:]))
+
+    return elapsed, usage.ru_maxrss / 1024.0
+
+
+def load_profile(output):
+    # the profile written next to the output of the tool
+    path = output + ".profile.json"
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def run_benchmark(name, scale, data_dir, repeat, cores):
+    generator, build, unit = BENCHMARKS[name]
+    start = time.time()
+    data = generators.generate(generator, scale, data_dir)
+    generate_seconds = time.time() - start
+    runs = []
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp(prefix="%s-%s." % (name, scale), dir=data_dir)
+        try:
+            cmd, output, items = build(data, workdir, cores)
+            if accepts(BIN_DIR, cmd[0], "--profile"):
+                cmd = cmd + ["--profile"]
+            seconds, peak_rss = run_tool(cmd, workdir)
+            runs.append(
+                {
+                    "seconds": seconds,
+                    "peak_rss_mb": peak_rss,
+                    "items": items,
+                    "profile": load_profile(output),
+                }
+            )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    best = min(runs, key=lambda x: x["seconds"])
+    stages = best["profile"]["spans"] if best["profile"] else {}
+
+    return {
+        "benchmark": name,
+        "scale": scale,
+        "unit": unit,
+        "items": best["items"],
+        "seconds": best["seconds"],
+        "seconds_all": [x["seconds"] for x in runs],
+        "throughput": best["items"] / best["seconds"] if best["seconds"] > 0 else None,
+        "peak_rss_mb": max(x["peak_rss_mb"] for x in runs),
+        "generate_seconds": generate_seconds,
+        "stages": {k: {"seconds": v["seconds"], "peak_rss_mb": v["peak_rss_mb"]} for k, v in stages.items()},
+        "counters": best["profile"]["counters"] if best["profile"] else {},
+    }
+
+
+def git_commit():
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL)
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), "hicar-bench-data")
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+    for scale in args.scales:
+        for name in args.benchmarks:
+            sys.stderr.write("%s (%s)... " % (name, scale))
+            sys.stderr.flush()
+            try:
+                result = run_benchmark(name, scale, data_dir, args.repeat, args.cores)
+            except (ImportError, OSError, RuntimeError) as e:
+                # a missing dependency of the tool or of the generator skips the benchmark
+                sys.stderr.write("skipped: %s\n" % str(e).strip().splitlines()[-1])
+                results.append({"benchmark": name, "scale": scale, "skipped": str(e)})
+                continue
+            sys.stderr.write(
+                "%.2fs, %.3g %s/s, %.0f Mb\n"
+                % (result["seconds"], result["throughput"], result["unit"], result["peak_rss_mb"])
+            )
+            results.append(result)
+
+    report = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": socket.gethostname(),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "cores": args.cores,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    sys.stderr.write("results saved to %s\n" % args.output)
+
+
+def compare(args):
+    # ratio of the wall time and peak memory of the new results over the base, flag the regressions
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    base_results = {(x["benchmark"], x["scale"]): x for x in base["results"] if "skipped" not in x}
+    print("base: %s (%s)" % (base["commit"], base["date"]))
+    print("new:  %s (%s)" % (new["commit"], new["date"]))
+    print(
+        "%-16s %-8s %10s %10s %8s %10s %10s %8s"
+        % ("benchmark", "scale", "base_s", "new_s", "time", "base_mb", "new_mb", "memory")
+    )
+    regressions = 0
+    for result in new["results"]:
+        key = (result["benchmark"], result["scale"])
+        if "skipped" in result or key not in base_results:
+            continue
+        old = base_results[key]
+        time_ratio = result["seconds"] / old["seconds"]
+        memory_ratio = result["peak_rss_mb"] / old["peak_rss_mb"]
+        flag = ""
+        if time_ratio > 1 + args.threshold or memory_ratio > 1 + args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(
+            "%-16s %-8s %10.2f %10.2f %7.2fx %10.0f %10.0f %7.2fx%s"
+            % (
+                key[0],
+                key[1],
+                old["seconds"],
+                result["seconds"],
+                time_ratio,
+                old["peak_rss_mb"],
+                result["peak_rss_mb"],
+                memory_ratio,
+                flag,
+            )
+        )
+
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the bin/ tools on synthetic data")
+    subparsers = parser.add_subparsers(dest="command")
+    parser_run = subparsers.add_parser("run", help="run the benchmarks")
+    parser_run.add_argument(
+        "-b", "--benchmarks", nargs="+", default=list(BENCHMARKS), choices=list(BENCHMARKS), help="benchmarks to run"
+    )
+    parser_run.add_argument(
+        "-s", "--scales", nargs="+", default=["small"], choices=list(generators.SCALES), help="data scales"
+    )
+    parser_run.add_argument("-r", "--repeat", type=int, default=3, help="runs of every benchmark, the best is kept")
+    parser_run.add_argument("-c", "--cores", type=int, default=1, help="cores given to the tools")
+    parser_run.add_argument("-d", "--data-dir", dest="data_dir", help="folder of the generated data, kept between runs")
+    parser_run.add_argument("-o", "--output", default="benchmark_results.json", help="output json file")
+    parser_compare = subparsers.add_parser("compare", help="compare two result files")
+    parser_compare.add_argument("base", help="results of the base commit")
+    parser_compare.add_argument("new", help="results to compare")
+    parser_compare.add_argument(
+        "--threshold", type=float, default=0.1, help="relative increase of time or memory reported as a regression"
+    )
+    args = parser.parse_args()
+
+    if args.command == "run":
+        return run(args)
+    if args.command == "compare":
+        return compare(args)
+    parser.print_help()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+#########################################
+# File: equivalence.py
+# Differential test of the engines of the bin/ tools on the synthetic data of
+# generators.py: the legacy engine and the fast engine of a tool run on the
+# same inputs, and their outputs must match up to a float tolerance, and up
+# to the row order for the outputs whose order does not matter downstream.
+#   equivalence.py [-t maps pairsqc ...] [--legacy REV] [--fast REV] [-s small]
+# An engine is the bin/ folder of a git revision (the working tree by
+# default), plus the options selecting the engine of the tools having
+# several, e.g. --backend sklearn|compiled of peakachu_score_genome.py, given
+# only to the revisions having them. The tools with a single engine compare two
+# revisions, so --legacy REV is required for them. The wall time of both engines
+# is reported side by side. Exits with 1 if any output differs or any engine
+# fails to run.
+# This source code is licensed under the MIT license
+#########################################
+
+import os
+import sys
+import glob
+import math
+import shutil
+import argparse
+import tempfile
+import subprocess
+import bench
+import generators
+
+# per tool: the options of each engine, left out for the revisions without the first one,
+# None for the tools with a single engine, and the outputs compared with
+#   header: lines at the top compared as they are
+#   ordered: whether the row order matters
+#   ignore: columns left out of the comparison, e.g. the row index of pandas
+TOOLS = {
+    "feature_frag2bin": {
+        "engines": None,
+        "outputs": {"bench.features.txt": {"header": 0, "ordered": True, "ignore": []}},
+    },
+    "maps": {
+        "engines": None,
+        "outputs": {
+            "reg_raw.*": {"header": 1, "ordered": False, "ignore": [0]},
+            "bench.maps.qc": {"header": 0, "ordered": False, "ignore": []},
+        },
+    },
+    "pairsqc": {
+        "engines": None,
+        "outputs": {"bench_report/*.out": {"header": 0, "ordered": True, "ignore": []}},
+    },
+    "peakachu": {
+        "engines": {"legacy": ["--backend", "sklearn"], "fast": ["--backend", "compiled"]},
+        "outputs": {"bench.loops.bedpe": {"header": 0, "ordered": False, "ignore": []}},
+    },
+}
+
+
+def checkout_bin(ref, root):
+    # the bin/ folder of a git revision, None for the working tree
+    if ref is None:
+        return bench.BIN_DIR
+    folder = os.path.join(root, "bin-" + ref.replace("/", "_"))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+        archive = subprocess.Popen(["git", "archive", ref, "bin"], cwd=bench.REPO_DIR, stdout=subprocess.PIPE)
+        subprocess.check_call(["tar", "-x", "--strip-components=1", "-C", folder], stdin=archive.stdout)
+        if archive.wait() != 0:
+            raise RuntimeError("can not read bin/ at %s" % ref)
+
+    return folder
+
+
+def parse_field(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+def read_rows(path, spec):
+    with open(path) as f:
+        lines = f.read().splitlines()
+    header = lines[: spec["header"]]
+    rows = [
+        [parse_field(x) for i, x in enumerate(line.split("\t")) if i not in spec["ignore"]]
+        for line in lines[spec["header"] :]
+    ]
+    if not spec["ordered"]:
+        # rounded, so the order does not depend on the last digits
+        rows.sort(key=lambda row: [("f", round(x, 6)) if isinstance(x, float) else ("s", x) for x in row])
+
+    return header, rows
+
+
+def same_value(a, b, rtol, atol):
+    if isinstance(a, float) and isinstance(b, float):
+        if math.isnan(a) or math.isnan(b):
+            return math.isnan(a) and math.isnan(b)
+        return math.isclose(a, b, rel_tol=rtol, abs_tol=atol)
+
+    return a == b
+
+
+def compare_file(legacy, fast, spec, rtol, atol, max_report=5):
+    # differences between the outputs of both engines, as messages
+    legacy_header, legacy_rows = read_rows(legacy, spec)
+    fast_header, fast_rows = read_rows(fast, spec)
+    diffs = []
+    if legacy_header != fast_header:
+        diffs.append("header: %r != %r" % (legacy_header, fast_header))
+    if len(legacy_rows) != len(fast_rows):
+        diffs.append("rows: %d != %d" % (len(legacy_rows), len(fast_rows)))
+    for i, (a, b) in enumerate(zip(legacy_rows, fast_rows)):
+        if len(a) != len(b) or not all(same_value(x, y, rtol, atol) for x, y in zip(a, b)):
+            diffs.append("row %d: %r != %r" % (i + 1, a, b))
+            if len(diffs) >= max_report:
+                diffs.append("...")
+                break
+
+    return diffs
+
+
+def run_engine(tool, engine, bin_dir, data, root):
+    workdir = tempfile.mkdtemp(prefix="%s-%s." % (tool, engine), dir=root)
+    cmd, _, _ = bench.BENCHMARKS[tool][1](data, workdir, 1, bin_dir)
+    options = (TOOLS[tool]["engines"] or {}).get(engine)
+    if options and bench.accepts(bin_dir, cmd[0], options[0]):
+        cmd = cmd + options
+    seconds, peak_rss = bench.run_tool(cmd, workdir, bin_dir)
+
+    return workdir, seconds, peak_rss
+
+
+def check_tool(tool, args, bins, root):
+    data = generators.generate(bench.BENCHMARKS[tool][0], args.scale, args.data_dir)
+    legacy_dir, legacy_seconds, legacy_rss = run_engine(tool, "legacy", bins["legacy"], data, root)
+    fast_dir, fast_seconds, fast_rss = run_engine(tool, "fast", bins["fast"], data, root)
+
+    diffs = []
+    compared = 0
+    for pattern, spec in TOOLS[tool]["outputs"].items():
+        legacy_files = sorted(os.path.relpath(x, legacy_dir) for x in glob.glob(os.path.join(legacy_dir, pattern)))
+        fast_files = sorted(os.path.relpath(x, fast_dir) for x in glob.glob(os.path.join(fast_dir, pattern)))
+        if legacy_files != fast_files:
+            diffs.append("%s: files %s != %s" % (pattern, legacy_files, fast_files))
+        if not legacy_files:
+            diffs.append("%s: no output" % pattern)
+        for name in sorted(set(legacy_files) & set(fast_files)):
+            compared += 1
+            diffs.extend(
+                "%s: %s" % (name, x)
+                for x in compare_file(
+                    os.path.join(legacy_dir, name), os.path.join(fast_dir, name), spec, args.rtol, args.atol
+                )
+            )
+
+    print(
+        "%-16s %-8s %10.2f %10.2f %7.2fx %10.0f %10.0f %6d  %s"
+        % (
+            tool,
+            args.scale,
+            legacy_seconds,
+            fast_seconds,
+            legacy_seconds / fast_seconds if fast_seconds > 0 else float("nan"),
+            legacy_rss,
+            fast_rss,
+            compared,
+            "DIFFERENT" if diffs else "same",
+        )
+    )
+    for diff in diffs:
+        print("    " + diff)
+    if not args.keep:
+        shutil.rmtree(legacy_dir, ignore_errors=True)
+        shutil.rmtree(fast_dir, ignore_errors=True)
+
+    return not diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the outputs of the legacy and fast engines of the bin/ tools")
+    parser.add_argument("-t", "--tools", nargs="+", default=list(TOOLS), choices=list(TOOLS), help="tools to compare")
+    parser.add_argument(
+        "--legacy",
+        default=None,
+        help="git revision of the legacy engine, required for the tools with a single engine "
+        "(default: the working tree, with its options)",
+    )
+    parser.add_argument(
+        "--fast", default=None, help="git revision of the fast engine (default: the working tree, with its options)"
+    )
+    parser.add_argument("-s", "--scale", default="small", choices=list(generators.SCALES), help="data scale")
+    parser.add_argument("--rtol", type=float, default=1e-6, help="relative tolerance of the floats")
+    parser.add_argument("--atol", type=float, default=1e-9, help="absolute tolerance of the floats")
+    parser.add_argument("-d", "--data-dir", dest="data_dir", help="folder of the generated data, kept between runs")
+    parser.add_argument("--keep", action="store_true", help="keep the outputs of both engines")
+    args = parser.parse_args()
+    single = [tool for tool in args.tools if TOOLS[tool]["engines"] is None]
+    if single and args.legacy == args.fast:
+        # the same bin/ folder on both sides would only be compared with itself
+        parser.error("--legacy REV is required for the tools with a single engine: %s" % ", ".join(single))
+    args.data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), "hicar-bench-data")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    root = tempfile.mkdtemp(prefix="equivalence.", dir=args.data_dir)
+    ok = True
+    try:
+        bins = {"legacy": checkout_bin(args.legacy, root), "fast": checkout_bin(args.fast, root)}
+        print(
+            "%-16s %-8s %10s %10s %8s %10s %10s %6s  %s"
+            % ("tool", "scale", "legacy_s", "fast_s", "speedup", "legacy_mb", "fast_mb", "files", "outputs")
+        )
+        for tool in args.tools:
+            try:
+                ok = check_tool(tool, args, bins, root) and ok
+            except (ImportError, OSError, RuntimeError) as e:
+                # a tool that can not run can not be shown equivalent
+                print("%-16s %-8s FAILED: %s" % (tool, args.scale, str(e).strip().splitlines()[-1]))
+                ok = False
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
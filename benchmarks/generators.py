@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+
+#########################################
+# File: generators.py
+# Deterministic synthetic HiCAR data for the benchmarks of the bin/ tools:
+# FASTA for restriction_cut_multipleenzyme.py, restriction fragments with
+# mappability for feature_frag2bin.py, MACS2 peaks, genomic features,
+# short bed and long bedpe per chromosome pair for MAPS.py, pairix-indexed
+# pairs for pairsqc.py, and a cooler plus a small random forest model for
+# peakachu_score_genome.py. Every generator takes a seed and writes into an
+# output folder, the same seed and scale always give the same files.
+# This source code is licensed under the MIT license
+#########################################
+
+import os
+import sys
+import json
+import numpy as np
+
+BIN_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bin")
+sys.path.insert(0, BIN_DIR)
+import bgzf
+
+# parameters of the data of every tool at each scale
+SCALES = {
+    "small": {
+        "chroms": 3,
+        "chrom_size": 2000000,
+        "bin_size": 5000,
+        "peaks": 200,
+        "short": 20000,
+        "long": 100000,
+        "pairs": 200000,
+        "resolution": 10000,
+        "depth": 200.0,
+    },
+    "medium": {
+        "chroms": 6,
+        "chrom_size": 10000000,
+        "bin_size": 5000,
+        "peaks": 2000,
+        "short": 200000,
+        "long": 1000000,
+        "pairs": 2000000,
+        "resolution": 10000,
+        "depth": 400.0,
+    },
+    "large": {
+        "chroms": 12,
+        "chrom_size": 25000000,
+        "bin_size": 5000,
+        "peaks": 10000,
+        "short": 1000000,
+        "long": 5000000,
+        "pairs": 10000000,
+        "resolution": 10000,
+        "depth": 800.0,
+    },
+}
+
+
+def chrom_sizes(params):
+    # chr1 is the longest, as in real genomes
+    n = params["chroms"]
+    sizes = np.linspace(params["chrom_size"], params["chrom_size"] // 2, n).astype(np.int64)
+    return [("chr%d" % (i + 1), int(size)) for i, size in enumerate(sizes)]
+
+
+def write_chrom_sizes(path, sizes):
+    with open(path, "w") as f:
+        for name, size in sizes:
+            f.write("%s\t%d\n" % (name, size))
+
+
+def fasta(outdir, params, seed=0, gc=0.42, line_width=60):
+    # random genome with the GC content of the human genome, some lower case
+    # (soft-masked) stretches and some N gaps
+    rng = np.random.RandomState(seed)
+    path = os.path.join(outdir, "genome.fa")
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+    with open(path, "wb") as f:
+        for name, size in chrom_sizes(params):
+            p = [(1 - gc) / 2, gc / 2, gc / 2, (1 - gc) / 2]
+            seq = bases[rng.choice(4, size=size, p=p)].copy()
+            for start in rng.randint(0, size, size // 200000 + 1):
+                seq[start : start + 5000] |= 0x20
+            for start in rng.randint(0, size, size // 1000000 + 1):
+                seq[start : start + 1000] = ord("N")
+            f.write((">%s\n" % name).encode())
+            for i in range(0, size, line_width):
+                f.write(seq[i : i + line_width].tobytes() + b"\n")
+
+    return {"fasta": path, "bases": int(sum(size for _, size in chrom_sizes(params)))}
+
+
+def fragments(outdir, params, seed=0):
+    # restriction fragments with their GC and mappability, as merged by merge_map.py:
+    # num, strand, chrom, pos, fragment length, GC, mappability
+    rng = np.random.RandomState(seed)
+    sizes = chrom_sizes(params)
+    path = os.path.join(outdir, "bench.fragments.txt")
+    write_chrom_sizes(os.path.join(outdir, "bench.chrom.sizes"), sizes)
+    count = 0
+    with open(path, "w") as f:
+        for name, size in sizes:
+            # a site every 256bp on average, as a 4-cutter
+            sites = np.unique(rng.randint(0, size, size // 256))
+            lengths = np.diff(np.r_[0, sites, size])
+            for strand in ("+", "-"):
+                pos = np.r_[0, sites] if strand == "+" else np.r_[sites, size]
+                gc = rng.uniform(0.2, 0.7, pos.size)
+                mappability = rng.uniform(0, 1, pos.size)
+                f.write(
+                    "".join(
+                        "%d\t%s\t%s\t%d\t%d\t%s\t%s\n" % (count + i, strand, name, p, l, "%.4f" % g, "%.6g" % m)
+                        for i, (p, l, g, m) in enumerate(
+                            zip(pos.tolist(), lengths.tolist(), gc.tolist(), mappability.tolist())
+                        )
+                    )
+                )
+                count += pos.size
+
+    return {"fragments": path, "chrom_sizes": os.path.join(outdir, "bench.chrom.sizes"), "count": count}
+
+
+def maps_inputs(outdir, params, seed=0):
+    # inputs of MAPS.py: the run file, MACS2 peaks, genomic features, short reads
+    # per chromosome, and long pairs per chromosome pair with their index, as
+    # written by split_bedpe.py. The long pairs decay with the distance.
+    rng = np.random.RandomState(seed)
+    sizes = chrom_sizes(params)
+    bin_size = params["bin_size"]
+    prefix = os.path.join(outdir, "bench")
+
+    with open(prefix + ".peaks.bed", "w") as f:
+        for name, size in sizes:
+            starts = np.sort(rng.randint(0, size - 2000, params["peaks"] // len(sizes)))
+            for start, width in zip(starts, rng.randint(200, 2000, starts.size)):
+                f.write("%s\t%d\t%d\n" % (name, start, start + width))
+
+    with open(prefix + ".features.txt", "w") as f:
+        for name, size in sizes:
+            for start in range(0, size, bin_size):
+                f.write(
+                    "%s\t%d\t%d\t%d\t%.4f\t%.4f\n"
+                    % (
+                        name,
+                        start,
+                        min(start + bin_size, size),
+                        rng.randint(1, bin_size),
+                        rng.uniform(0.3, 0.6),
+                        rng.uniform(0.5, 1.0),
+                    )
+                )
+
+    lengths = np.array([size for _, size in sizes], dtype=np.float64)
+    for name, size in sizes:
+        n = int(params["short"] * size / lengths.sum())
+        starts = np.sort(rng.randint(0, size - 100, n))
+        with open("%s.%s.shrt.vip.bed" % (prefix, name), "w") as f:
+            f.write("".join("%s\t%d\t%d\tr%d\n" % (name, s, s + 50, i) for i, s in enumerate(starts)))
+
+    # 80% of the long pairs are cis, the others are spread over the chromosome pairs
+    index = []
+    for i, (chr1, size1) in enumerate(sizes):
+        for chr2, size2 in sizes[i:]:
+            if chr1 == chr2:
+                n = int(params["long"] * 0.8 * size1 / lengths.sum())
+                start1 = rng.randint(0, size1, n)
+                start2 = start1 + (rng.pareto(0.8, n) * 20000).astype(np.int64)
+                keep = start2 < size1
+                start1, start2 = start1[keep], start2[keep]
+            else:
+                n = int(params["long"] * 0.2 / (len(sizes) * (len(sizes) - 1) / 2))
+                start1 = rng.randint(0, size1, n)
+                start2 = rng.randint(0, size2, n)
+            start1 = start1 // bin_size * bin_size
+            start2 = start2 // bin_size * bin_size
+            pixels, counts = np.unique(np.c_[start1, start2], axis=0, return_counts=True)
+            fname = "%s.%s_%s.long.bedpe" % (prefix, chr1, chr2)
+            with open(fname, "w") as f:
+                f.write(
+                    "".join(
+                        "%s\t%d\t%d\t%s\t%d\t%d\t%d\n" % (chr1, s1, s1 + bin_size, chr2, s2, s2 + bin_size, c)
+                        for (s1, s2), c in zip(pixels.tolist(), counts.tolist())
+                    )
+                )
+            index.append((chr1, chr2, os.path.basename(fname), len(counts)))
+    with open(prefix + ".long.bedpe.index", "w") as f:
+        for row in index:
+            f.write("%s\t%s\t%s\t%d\n" % row)
+
+    run_file = os.path.join(outdir, "bench.maps.run")
+    with open(run_file, "w") as f:
+        f.write("DATASET_NAME=bench\n")
+        f.write("OUT_DIR=%s/\n" % outdir)
+        f.write("BINNING_RANGE=1000000\n")
+        f.write("BIN_SIZE=%d\n" % bin_size)
+        f.write("MACS2_PATH=%s.peaks.bed\n" % prefix)
+        f.write("GF_PATH=%s.features.txt\n" % prefix)
+        f.write("LONG_PATH=%s.\n" % prefix)
+        f.write("LONG_FORMAT=[CHROMOSOME].long.intra.bedpe\n")
+        f.write("SHORT_PATH=%s.\n" % prefix)
+        f.write("SHORT_FORMAT=[CHROMOSOME].shrt.vip.bed\n")
+
+    return {"run_file": run_file, "long_pairs": int(sum(row[3] for row in index))}
+
+
+def pairs(outdir, params, seed=0):
+    # pairs sorted by chr1-chr2-pos1-pos2 as pairtools, compressed as BGZF and indexed by pairix
+    rng = np.random.RandomState(seed)
+    sizes = chrom_sizes(params)
+    path = os.path.join(outdir, "bench.pairs.gz")
+    write_chrom_sizes(os.path.join(outdir, "bench.chrom.sizes"), sizes)
+    strands = np.array(["+", "-"])
+    n = params["pairs"]
+    names = np.array([name for name, _ in sizes])
+    lengths = np.array([size for _, size in sizes], dtype=np.int64)
+
+    chrom1 = rng.choice(len(sizes), n, p=lengths / lengths.sum())
+    cis = rng.uniform(size=n) < 0.8
+    chrom2 = np.where(cis, chrom1, rng.choice(len(sizes), n))
+    # upper triangle, as pairtools
+    chrom1, chrom2 = np.minimum(chrom1, chrom2), np.maximum(chrom1, chrom2)
+    pos1 = (rng.uniform(size=n) * lengths[chrom1]).astype(np.int64) + 1
+    pos2 = np.where(
+        cis,
+        pos1 + (rng.pareto(0.8, n) * 1000).astype(np.int64),
+        (rng.uniform(size=n) * lengths[chrom2]).astype(np.int64) + 1,
+    )
+    keep = pos2 <= lengths[chrom2]
+    chrom1, chrom2, pos1, pos2 = chrom1[keep], chrom2[keep], pos1[keep], pos2[keep]
+    # sort by the chromosome names as pairtools
+    rank = np.argsort(np.argsort(names))
+    order = np.lexsort((pos2, pos1, rank[chrom2], rank[chrom1]))
+    chrom1, chrom2, pos1, pos2 = chrom1[order], chrom2[order], pos1[order], pos2[order]
+    strand1 = strands[rng.randint(0, 2, pos1.size)]
+    strand2 = strands[rng.randint(0, 2, pos1.size)]
+
+    header = ["## pairs format v1.0", "#sorted: chr1-chr2-pos1-pos2", "#shape: upper triangle"]
+    header.extend("#chromsize: %s %d" % (name, size) for name, size in sizes)
+    header.append("#columns: readID chr1 pos1 chr2 pos2 strand1 strand2 pair_type")
+    with bgzf.Writer(path) as out:
+        out.write(("\n".join(header) + "\n").encode())
+        for start in range(0, pos1.size, 1000000):
+            end = min(start + 1000000, pos1.size)
+            out.write(
+                "".join(
+                    "r%d\t%s\t%d\t%s\t%d\t%s\t%s\tUU\n" % (start + i, c1, p1, c2, p2, s1, s2)
+                    for i, (c1, p1, c2, p2, s1, s2) in enumerate(
+                        zip(
+                            names[chrom1[start:end]].tolist(),
+                            pos1[start:end].tolist(),
+                            names[chrom2[start:end]].tolist(),
+                            pos2[start:end].tolist(),
+                            strand1[start:end].tolist(),
+                            strand2[start:end].tolist(),
+                        )
+                    )
+                ).encode()
+            )
+    pairix_index(path)
+
+    return {"pairs": path, "chrom_sizes": os.path.join(outdir, "bench.chrom.sizes"), "count": int(pos1.size)}
+
+
+def pairix_index(path):
+    try:
+        import pypairix
+
+        pypairix.build_index(path, preset="pairs", force=1)
+    except ImportError:
+        import subprocess
+
+        subprocess.check_call(["pairix", "-f", "-p", "pairs", path])
+
+
+def cooler_model(outdir, params, seed=0, width=5):
+    # cooler with a distance decay, some enriched pixels and some empty bins, balanced,
+    # and a random forest trained on random windows of (2 * width + 1)^2 features
+    import cooler
+    import joblib
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.RandomState(seed)
+    res = params["resolution"]
+    sizes = chrom_sizes(params)
+    chromsizes = pd.Series(dict(sizes))
+    bins = cooler.util.binnify(chromsizes, res)
+    offsets = np.r_[0, np.cumsum([-(-size // res) for _, size in sizes])]
+    pixels = []
+    for ci in range(len(sizes)):
+        n = offsets[ci + 1] - offsets[ci]
+        for d in range(min(n, 400)):
+            i = np.arange(n - d)
+            counts = rng.poisson(params["depth"] / (d + 1), size=i.size)
+            enriched = rng.uniform(size=i.size) < 0.002
+            counts[enriched] += rng.poisson(30, size=enriched.sum())
+            keep = counts > 0
+            pixels.append(
+                pd.DataFrame(
+                    {"bin1_id": offsets[ci] + i[keep], "bin2_id": offsets[ci] + i[keep] + d, "count": counts[keep]}
+                )
+            )
+    pixels = pd.concat(pixels).sort_values(["bin1_id", "bin2_id"])
+    bad = rng.choice(offsets[-1], max(1, offsets[-1] // 200), replace=False)
+    pixels = pixels[~pixels.bin1_id.isin(bad) & ~pixels.bin2_id.isin(bad)]
+    path = os.path.join(outdir, "bench.cool")
+    cooler.create_cooler(path, bins, pixels, ordered=True)
+    cooler.balance_cooler(cooler.Cooler(path), store=True, chunksize=1000000)
+
+    n_features = (2 * width + 1) ** 2
+    X = rng.uniform(size=(2000, n_features))
+    y = (X[:, n_features // 2] > 0.6).astype(int)
+    model = RandomForestClassifier(n_estimators=20, max_depth=8, random_state=seed).fit(X, y)
+    model_path = os.path.join(outdir, "bench.model.pkl")
+    joblib.dump(model, model_path)
+
+    return {"cool": path, "model": model_path, "pixels": int(len(pixels))}
+
+
+GENERATORS = {
+    "fasta": fasta,
+    "fragments": fragments,
+    "maps": maps_inputs,
+    "pairs": pairs,
+    "cooler": cooler_model,
+}
+
+
+def generate(name, scale, root, seed=0):
+    # generate the data once per (name, scale, seed) in root, and return its description
+    outdir = os.path.join(root, "%s-%s-%d" % (name, scale, seed))
+    done = os.path.join(outdir, "data.json")
+    if os.path.exists(done):
+        with open(done) as f:
+            return json.load(f)
+    os.makedirs(outdir, exist_ok=True)
+    data = GENERATORS[name](outdir, SCALES[scale], seed=seed)
+    with open(done, "w") as f:
+        json.dump(data, f)
+
+    return data
@@ -26,8 +26,10 @@ import numpy as np
 import pandas as pd
 import argparse
 import sys
+import os
 import itertools
 import re
+import profiling
 
 
 def get_segment_range(bin_start, bin_end):
@@ -132,6 +134,33 @@ def parse_fname(chrom, type, params):
     return fname
 
 
+def load_long_index(params):
+    ## chromosome pairs listed in the index written by split_bedpe.py, None if there is no index
+    fname = params["LONG_PATH"] + params["LONG_FORMAT"].replace("[CHROMOSOME].", "") + ".index"
+    for p in params:
+        pn = "[" + p + "]"
+        if pn in fname:
+            fname = fname.replace(pn, params[p])
+    if not os.path.exists(fname):
+        return None
+    index = pd_read_tab(["chr1", "chr2", "file", "count"], filepath_or_buffer=fname, header=None, sep="\t")
+    return set(zip(index[0].astype(str), index[1].astype(str))) if index.shape[0] else set()
+
+
+def read_long(fname, CHR1, CHR2, long_cols):
+    ## long reads of a chromosome pair, as text (optionally compressed) or as numpy array (.npy)
+    if fname.endswith(".npy"):
+        try:
+            records = np.load(fname)
+        except Exception:
+            return pd.DataFrame(columns=long_cols)
+        ps_long = pd.DataFrame({name: records[name] for name in records.dtype.names})
+        ps_long.insert(0, "chr1", CHR1)
+        ps_long.insert(3, "chr2", CHR2)
+        return ps_long
+    return pd_read_tab(long_cols, filepath_or_buffer=fname, header=None, sep="\t", low_memory=False)
+
+
 def get_chrom_from_MACS2(MACS2_full):
     chr = []
     if MACS2_full.shape[0]:
@@ -179,6 +208,8 @@ def init(p):
     )
     input_data = input_data.transpose()
     params = validate_input_data(input_data, p.long_bedpe_postfix, p.short_bed_postfix)
+    profiling.setup(p.profile, params["OUT_DIR"] + params["DATASET_NAME"] + ".maps")
+    profiling.stage("load")
     print("loading MACS2 peaks")
     MACS2_full = load_MACS2(params["MACS2_PATH"])
     ## setting up chromosomes, TODO: extract the chromosome from MACS2_full["chr"], make sure use the clean chromosomes
@@ -196,8 +227,11 @@ def init(p):
     params["BIN_RANGE"] = float(params["BINNING_RANGE"]) / float(params["BIN_SIZE"])
     print("loading metadata file")
     metadata_full = load_metadata(params["GF_PATH"], params["BIN_SIZE"])
+    ## the chromosome pairs with long reads, the others are skipped without reading the files
+    long_pairs = load_long_index(params)
     qc_str = ""  ## content of qc.maps file
     for CHR1 in chroms:
+        profiling.stage("load")
         peak_skip, MACS2_peak_ranges_list_1 = get_peaks_range(MACS2_full, CHR1, params)
         ps_short1 = pd_read_tab(
             ["chr", "start", "end"], filepath_or_buffer=parse_fname(CHR1, "short", params), header=None, sep="\t"
@@ -208,6 +242,7 @@ def init(p):
             print("doing chromosome ", CHR1, " and ", CHR2, "\n")
             # handling MACS2 peaks
             print("-- handling MACS2 peaks")
+            profiling.stage("load")
             peak_skip2, MACS2_peak_ranges_list_2 = get_peaks_range(MACS2_full, CHR2, params)
             if peak_skip2:
                 continue
@@ -222,6 +257,7 @@ def init(p):
                 ps_short = pd.concat([ps_short1, ps_short2], ignore_index=True)
             else:
                 ps_short = ps_short1
+            profiling.count("short_reads", ps_short.shape[0])
             if ps_short.shape[0]:
                 new_cols = ["chr", "start", "end", "name"]
                 ps_short.rename(columns=dict(zip(ps_short.columns[0:], new_cols)), inplace=True)
@@ -234,14 +270,13 @@ def init(p):
                 ##### getting overlap
                 ## load long.bed file
                 long_cols = ["chr1", "start1", "end1", "chr2", "start2", "end2", "count"]
-                ps_long = pd_read_tab(
-                    long_cols,
-                    filepath_or_buffer=parse_fname(CHR1 + "_" + CHR2, "long", params),
-                    header=None,
-                    sep="\t",
-                    low_memory=False,
-                )
+                if long_pairs is not None and (CHR1, CHR2) not in long_pairs:
+                    ps_long = pd.DataFrame(columns=long_cols)
+                else:
+                    ps_long = read_long(parse_fname(CHR1 + "_" + CHR2, "long", params), CHR1, CHR2, long_cols)
                 ps_long.rename(columns=dict(zip(ps_long.columns[0:], long_cols)), inplace=True)
+                profiling.count("long_pairs", ps_long.shape[0])
+                profiling.stage("filter")
                 if ps_long.shape[0]:
                     ps_long = ps_long.astype({"chr1": str, "chr2": str})
                     ## filter only reads at the same chromosome and proper orientation
@@ -315,6 +350,7 @@ def init(p):
                         + "\n"
                     )
                     print("-- handling metadata\n")
+                    profiling.stage("merge")
                     metadata = metadata_full[metadata_full["chr"].isin([CHR1, CHR2])].copy()
                     metadata = pd.merge(metadata, count_data_short, on=["bin", "chr"], how="outer")
                     metadata["short_count"] = metadata["short_count"].fillna(0)
@@ -412,6 +448,9 @@ def init(p):
                     reg_xor["bin1_mid"] = reg_xor["bin1_mid"] * params["BIN_SIZE"]
                     reg_xor["bin2_mid"] = reg_xor["bin2_mid"] * params["BIN_SIZE"]
                     print("--saving output\n")
+                    profiling.stage("write")
+                    profiling.count("and_pairs", reg_and.shape[0])
+                    profiling.count("xor_pairs", reg_xor.shape[0])
                     fout_name = (
                         params["OUT_DIR"]
                         + "reg_raw."
@@ -447,10 +486,12 @@ def init(p):
                     ". Doing next chromosome",
                 )
     print("-- saving .qc.maps file\n")
+    profiling.stage("write")
     qc_fname = params["OUT_DIR"] + params["DATASET_NAME"] + ".maps.qc"
     qc_file = open(qc_fname, "w")
     qc_file.write(qc_str)
     qc_file.close()
+    profiling.stage(None)
 
 
 def main():
@@ -461,6 +502,7 @@ def main():
     parser.add_argument("run_file", help="file containing run parameters")
     parser.add_argument("long_bedpe_postfix", help="file extension for long bedpe")
     parser.add_argument("short_bed_postfix", help="file extension for short bed")
+    profiling.add_argument(parser)
     p = parser.parse_args(sys.argv[1:])
     init(p)
 
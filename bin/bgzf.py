@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+#########################################
+# File: bgzf.py
+# Minimal BGZF (blocked gzip) writer for the bin/ tools. Every block is an
+# independent gzip member of at most 64Kb, so blocks can be compressed in
+# parallel, and compressed streams can be concatenated as they are. The output
+# can be read by gunzip, and indexed by tabix like the output of bgzip.
+# This source code is licensed under the MIT license
+#########################################
+
+import zlib
+import shutil
+import struct
+from multiprocessing.pool import ThreadPool
+
+# uncompressed size of a block, as bgzip
+BLOCK_SIZE = 0xFF00
+# empty block marking the end of the file
+EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def compress_block(data, level=6):
+    # one BGZF block, split in two if it does not fit in 64Kb once compressed
+    deflate = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = deflate.compress(data) + deflate.flush()
+    if len(cdata) + 26 > 0x10000:
+        half = len(data) // 2
+        return compress_block(data[:half], level) + compress_block(data[half:], level)
+    header = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00" + struct.pack("<H", len(cdata) + 25)
+
+    return header + cdata + struct.pack("<II", zlib.crc32(data) & 0xFFFFFFFF, len(data))
+
+
+def compress(data, level=6):
+    # BGZF blocks of data, without the EOF marker
+    return b"".join(compress_block(data[i : i + BLOCK_SIZE], level) for i in range(0, len(data), BLOCK_SIZE))
+
+
+class Writer:
+    # write a BGZF file, the blocks are compressed by a pool of threads as zlib
+    # releases the GIL
+    def __init__(self, path, threads=1, level=6):
+        self.out = open(path, "wb")
+        self.level = level
+        self.pool = ThreadPool(threads) if threads > 1 else None
+        self.buffer = bytearray()
+        self.batch = BLOCK_SIZE * max(threads, 1) * 4
+
+    def write(self, data):
+        self.buffer.extend(data)
+        if len(self.buffer) >= self.batch:
+            self.flush(len(self.buffer) // BLOCK_SIZE * BLOCK_SIZE)
+
+    def write_compressed(self, data):
+        # append blocks compressed elsewhere, e.g. by bgzf.compress in another process
+        self.flush()
+        self.out.write(data)
+
+    def append(self, path):
+        # append a file of blocks compressed elsewhere
+        self.flush()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.out, 1 << 22)
+
+    def flush(self, size=None):
+        size = len(self.buffer) if size is None else size
+        blocks = [bytes(self.buffer[i : min(i + BLOCK_SIZE, size)]) for i in range(0, size, BLOCK_SIZE)]
+        del self.buffer[:size]
+        if self.pool is not None:
+            blocks = self.pool.map(lambda block: compress_block(block, self.level), blocks)
+        else:
+            blocks = [compress_block(block, self.level) for block in blocks]
+        self.out.write(b"".join(blocks))
+
+    def close(self):
+        self.flush()
+        self.out.write(EOF)
+        self.out.close()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -10,63 +10,160 @@
 
 import sys
 import argparse
+import numpy as np
+import pandas as pd
+import fragment_table
+import profiling
 
 
-def main():
-    parser = argparse.ArgumentParser(description="")
-    parser.add_argument("-i", "--input", dest="infile", required=True, help="input file")
-    parser.add_argument("-b", "--bin_size", dest="bin_size", required=True, help="bin_size")
-    parser.add_argument("-g", "--genome_size", dest="g_size", required=True, help="genome_size")
-    parser.add_argument("-o", "--output", dest="outfile", required=True, help="output file")
-    args = parser.parse_args()
+def read_fragments(infile):
+    # chromosome names, and arrays of chromosome index, position, fragment length, GC and mappability
+    if fragment_table.is_table(infile):
+        table = fragment_table.load_table(infile)
+        if "mappability" not in table:
+            sys.exit(
+                "The fragment table %s has no mappability, please merge it with the mappability first (merge_map.py)."
+                % infile
+            )
+        return (
+            table["chroms"].tolist(),
+            table["chrom"],
+            table["pos"],
+            table["fraglen"],
+            table["gc"],
+            table["mappability"],
+        )
+    try:
+        feat = pd.read_csv(
+            infile,
+            sep="\t",
+            header=None,
+            usecols=[2, 3, 4, 5, 6],
+            dtype={2: str, 3: np.int64, 4: np.int64, 5: np.float64, 6: np.float64},
+            float_precision="round_trip",
+        )
+    except pd.errors.EmptyDataError:
+        empty = np.array([], dtype=np.int64)
+        return [], empty, empty, empty, empty.astype(np.float64), empty.astype(np.float64)
+    except ValueError as e:
+        # the columns requested by usecols are missing, e.g. a .cut file without the mappability
+        if "usecols" not in str(e).lower():
+            raise
+        sys.exit(
+            "The fragments file %s has no mappability column, please merge it with the mappability first (merge_map.py)."
+            % infile
+        )
+    chrom, names = pd.factorize(feat[2])
+
+    return list(names), chrom, feat[3].values, feat[4].values, feat[5].values, feat[6].values
+
 
-    bin_size = args.bin_size.replace("Kb", "000")
+def bin_features(gbin, fraglen, gc, mappability, nbins):
+    # mean GC, mean mappability and capped sum of the unique fragment lengths of each bin
+    count = np.bincount(gbin, minlength=nbins)
+    gc_sum = np.bincount(gbin, weights=gc, minlength=nbins)
+    map_sum = np.bincount(gbin, weights=mappability, minlength=nbins)
+    found = count > 0
+    gc_mean = np.zeros(nbins)
+    map_mean = np.zeros(nbins)
+    gc_mean[found] = gc_sum[found] / count[found]
+    map_mean[found] = map_sum[found] / count[found]
+
+    # fragment lengths of 1000 or more count as 1000
+    order = np.lexsort((fraglen, gbin))
+    b, length = gbin[order], fraglen[order]
+    unique = np.r_[True, (b[1:] != b[:-1]) | (length[1:] != length[:-1])] if b.size else np.array([], dtype=bool)
+    frag_len = np.bincount(b[unique], weights=np.minimum(length[unique], 1000), minlength=nbins)
+
+    return frag_len.astype(np.int64), gc_mean, map_mean
+
+
+def parse_bin_size(value):
+    bin_size = value.replace("Kb", "000")
     bin_size = bin_size.replace("Mb", "000000")
     try:
-        bin_size = int(bin_size)
+        return int(bin_size)
     except ValueError:
-        sys.exit("Unknown bin size %s, please double check." % args.bin_size)
+        sys.exit("Unknown bin size %s, please double check." % value)
 
+
+def read_genome_size(path):
     g_size = {}
-    with open(args.g_size, "r") as f:
+    with open(path, "r") as f:
         for line in f:
             key, value = line.rstrip().split("\t")
             g_size[key] = int(value)
 
-    feature_frag = {}
-    with open(args.infile, "r") as f:
-        for line in f:
-            feat = line.rstrip().split("\t")
-            assert feat[2] in g_size, "%s is not in genome size files!" % feat[2]
-            assert int(feat[3]) <= g_size[feat[2]], "%d is larger than size of %s!" % (int(feat[3]), feat[2])
-            key = "\t".join([feat[2], str((int(feat[3]) // bin_size))])
-            value = (int(feat[4]), float(feat[5]), float(feat[6]))  # frag length,GC,mappability
-            try:
-                feature_frag[key].append(value)
-            except KeyError:
-                feature_frag[key] = [value]
-    print(list(feature_frag.keys())[1:5])
-    with open(args.outfile, "w") as f:
-        for chr_name in sorted(g_size.keys(), key=lambda i: i[2:]):
-            for bin_num in range(int(g_size[chr_name] / bin_size + 1)):
-                key = "\t".join([chr_name, str(bin_num)])
-                try:
-                    # print(key)
-                    xtmp = feature_frag["\t".join([chr_name, str(bin_num)])]
-                    # print("found")
-                    xtmplen = list(set([i[0] for i in xtmp]))
-                    gc = sum([i[1] for i in xtmp]) / len(xtmp)
-                    frag_len = sum([i for i in xtmplen if i < 1000]) + len([i for i in xtmplen if i >= 1000]) * 1000
-                    mappability = sum([i[2] for i in xtmp]) / len(xtmp)
-                except KeyError:
-                    # print("not found")
-                    gc = 0
-                    frag_len = 0
-                    mappability = 0
-                f.write(
-                    "%s\t%d\t%d\t%d\t%.4f\t%.4f\n"
-                    % (chr_name, bin_num * bin_size, (bin_num + 1) * bin_size, frag_len, gc, mappability)
+    return g_size
+
+
+def genome_bins(g_size, bin_size):
+    # chromosomes in the output order, and the offset of their first bin among all the bins
+    chroms = sorted(g_size.keys(), key=lambda i: i[2:])
+    nbins = np.array([int(g_size[chr_name] / bin_size + 1) for chr_name in chroms], dtype=np.int64)
+
+    return chroms, np.r_[0, np.cumsum(nbins)]
+
+
+def check_fragments(names, chrom, pos, g_size):
+    for name in names:
+        assert name in g_size, "%s is not in genome size files!" % name
+    sizes = np.array([g_size[name] for name in names], dtype=np.int64)
+    too_far = np.flatnonzero(pos > sizes[chrom])
+    assert not too_far.size, "%d is larger than size of %s!" % (pos[too_far[0]], names[chrom[too_far[0]]])
+
+
+def write_features(f, chroms, offsets, bin_size, frag_len, gc_mean, map_mean):
+    for k, chr_name in enumerate(chroms):
+        lo, hi = offsets[k], offsets[k + 1]
+        bins = np.arange(hi - lo, dtype=np.int64)
+        f.write(
+            "".join(
+                "%s\t%d\t%d\t%d\t%.4f\t%.4f\n" % ((chr_name,) + row)
+                for row in zip(
+                    (bins * bin_size).tolist(),
+                    ((bins + 1) * bin_size).tolist(),
+                    frag_len[lo:hi].tolist(),
+                    gc_mean[lo:hi].tolist(),
+                    map_mean[lo:hi].tolist(),
                 )
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument(
+        "-i",
+        "--input",
+        dest="infile",
+        required=True,
+        help="input file or binary fragment table with mappability (.npz)",
+    )
+    parser.add_argument("-b", "--bin_size", dest="bin_size", required=True, help="bin_size")
+    parser.add_argument("-g", "--genome_size", dest="g_size", required=True, help="genome_size")
+    parser.add_argument("-o", "--output", dest="outfile", required=True, help="output file")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.setup(args.profile, args.outfile)
+
+    bin_size = parse_bin_size(args.bin_size)
+    g_size = read_genome_size(args.g_size)
+    chroms, offsets = genome_bins(g_size, bin_size)
+
+    with profiling.span("load"):
+        names, chrom, pos, fraglen, gc, mappability = read_fragments(args.infile)
+        check_fragments(names, chrom, pos, g_size)
+    profiling.count("fragments", pos.size)
+
+    with profiling.span("bin"):
+        start = np.array([offsets[chroms.index(name)] for name in names], dtype=np.int64)
+        gbin = start[chrom] + pos // bin_size
+        frag_len, gc_mean, map_mean = bin_features(gbin, fraglen, gc, mappability, offsets[-1])
+    profiling.count("bins", int(offsets[-1]))
+
+    with profiling.span("write"), open(args.outfile, "w") as f:
+        write_features(f, chroms, offsets, bin_size, frag_len, gc_mean, map_mean)
 
 
 if __name__ == "__main__":
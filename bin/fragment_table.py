@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+#########################################
+# File: fragment_table.py
+# Binary restriction fragment table shared by the MAPS genomic feature scripts
+# (restriction_cut_multipleenzyme.py, merge_map.py and feature_frag2bin.py).
+# The table is a numpy .npz archive with one array per column of the .cut
+# file, the chromosome names, and optionally the mappability of each fragment.
+# This source code is licensed under the MIT license
+#########################################
+
+import os
+import hashlib
+import numpy as np
+
+# columns of the .cut text file, chrom holds the index into the chroms array
+COLUMNS = ["num", "strand", "chrom", "pos", "fraglen", "gc"]
+# columns appended by merge_map.py
+EXTRA_COLUMNS = ["mappability"]
+
+
+def file_md5(path, blocksize=1 << 20):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(blocksize), b""):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def cache_key(*fields):
+    return hashlib.md5("\t".join(str(x) for x in fields).encode()).hexdigest()
+
+
+def is_table(path):
+    return path.endswith(".npz")
+
+
+def save_table(path, table):
+    # write next to the destination and rename, so an interrupted run never
+    # leaves a truncated table behind; the checksum is kept in path.md5
+    tmp = "{}.{}.tmp.npz".format(path, os.getpid())
+    np.savez(tmp, **table)
+    md5 = file_md5(tmp)
+    os.rename(tmp, path)
+    with open(path + ".md5", "w") as f:
+        f.write(md5 + "\n")
+
+    return md5
+
+
+def load_table(path, validate=True):
+    if validate and os.path.exists(path + ".md5"):
+        with open(path + ".md5") as f:
+            expected = f.read().strip()
+        if file_md5(path) != expected:
+            raise ValueError("Checksum of fragment table %s does not match %s.md5" % (path, path))
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def concatenate(tables):
+    # join per chromosome tables, re-indexing the chromosome column
+    chroms, columns = [], {}
+    for table in tables:
+        for key in COLUMNS + EXTRA_COLUMNS:
+            if key in table:
+                value = table[key] + len(chroms) if key == "chrom" else table[key]
+                columns.setdefault(key, []).append(value)
+        chroms.extend(table["chroms"].tolist())
+    result = {key: np.concatenate(value) for key, value in columns.items()}
+    result["chroms"] = np.array(chroms)
+
+    return result
+
+
+def write_text(out, table, chunksize=100000):
+    # same layout as the .cut file, plus the extra columns present in the table
+    names = table["chroms"].tolist()
+    extra = [key for key in EXTRA_COLUMNS if key in table]
+    for i in range(0, table["num"].size, chunksize):
+        block = slice(i, i + chunksize)
+        rows = zip(
+            table["num"][block].tolist(),
+            table["strand"][block].tolist(),
+            [names[c] for c in table["chrom"][block].tolist()],
+            table["pos"][block].tolist(),
+            table["fraglen"][block].tolist(),
+            table["gc"][block].tolist(),
+            *[table[key][block].tolist() for key in extra],
+        )
+        out.write("".join("\t".join(map(str, row)) + "\n" for row in rows))
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+
+#########################################
+# File: maps_genomic_features.py
+# Genomic features of the bins for MAPS in a single pass. The restriction fragments
+# (digested from the fasta, or read from a .cut file or fragment table) are kept in
+# memory one chromosome at a time: the mean mappability of their ends is read from
+# the bigwig file, the fragments under the cutoff are dropped, and the fragment
+# length, GC content and mappability are aggregated per bin. The output is the same
+# as running restriction_cut_multipleenzyme.py, bedtools slop, bigWigAverageOverBed,
+# merge_map.py and feature_frag2bin.py one after the other.
+# This source code is licensed under the MIT license
+#########################################
+
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import pyBigWig
+import multiprocessing as mp
+import fragment_table
+import feature_frag2bin
+import restriction_cut_multipleenzyme as digest
+
+
+def read_cut(path):
+    # fragment table of a .cut file or a binary fragment table
+    if fragment_table.is_table(path):
+        return fragment_table.load_table(path)
+    try:
+        cut = pd.read_csv(
+            path,
+            sep="\t",
+            header=None,
+            usecols=[1, 2, 3, 4, 5],
+            dtype={1: str, 2: str, 3: np.int64, 4: np.int64, 5: np.float64},
+            float_precision="round_trip",
+        )
+    except pd.errors.EmptyDataError:
+        return None
+    chrom, names = pd.factorize(cut[2])
+
+    return {
+        "strand": cut[1].values,
+        "chroms": np.array(names),
+        "chrom": chrom,
+        "pos": cut[3].values,
+        "fraglen": cut[4].values,
+        "gc": cut[5].values,
+    }
+
+
+def split_table(table):
+    # fragment tables of each chromosome, in the order of the input
+    for c, name in enumerate(table["chroms"].tolist()):
+        rows = table["chrom"] == c
+        fragments = {key: table[key][rows] for key in ["strand", "pos", "fraglen", "gc"]}
+        fragments["chroms"] = np.array([name])
+        yield fragments
+
+
+def bigwig_chrom(name, chroms):
+    # the name of the chromosome in the bigwig file, UCSC and Ensembl styles are both accepted
+    candidates = [name, "chr" + name]
+    if name.startswith("chr"):
+        candidates.append(name[3:])
+    if name in ("MT", "chrM", "M"):
+        candidates.extend(["chrM", "MT"])
+    for candidate in candidates:
+        if candidate in chroms:
+            return candidate
+
+    return None
+
+
+def fragment_ends(strand, pos, size, bin_size):
+    # the bin_size bases after the cut on the strand of the fragment, clipped to the
+    # chromosome, as bedtools slop -s -l 0 -r bin_size does
+    minus = strand == "-"
+    start = np.where(minus, np.maximum(pos - bin_size, 0), pos)
+    end = np.where(minus, pos, np.minimum(pos + bin_size, size))
+
+    return start, end
+
+
+def average_over_bed(bw, chrom, start, end, chunk=100000):
+    # sum of the values over [start, end) divided by its width, the bases without data
+    # counting as 0, like the mean0 column of bigWigAverageOverBed. The intervals are
+    # read for chunk regions at a time, so only those under them are held in memory
+    mean0 = np.zeros(start.size)
+    if chrom is None:
+        return mean0
+    for lo in range(0, start.size, chunk):
+        s, e = start[lo : lo + chunk], end[lo : lo + chunk]
+        if e.max() <= s.min():
+            continue
+        intervals = bw.intervals(chrom, int(s.min()), int(e.max()))
+        if not intervals:
+            continue
+        intervals = np.array(intervals)
+        iv_start, iv_end, value = intervals[:, 0].astype(np.int64), intervals[:, 1].astype(np.int64), intervals[:, 2]
+
+        # intervals first..last-1 overlap each region, expand them to (region, interval) pairs
+        first = np.searchsorted(iv_end, s, side="right")
+        last = np.searchsorted(iv_start, e, side="left")
+        count = np.maximum(last - first, 0)
+        region = np.repeat(np.arange(s.size), count)
+        offset = np.arange(region.size) - np.repeat(np.cumsum(count) - count, count)
+        k = first[region] + offset
+        overlap = np.minimum(iv_end[k], e[region]) - np.maximum(iv_start[k], s[region])
+        total = np.bincount(region, weights=value[k] * overlap, minlength=s.size)
+
+        width = e - s
+        valid = width > 0
+        mean0[lo : lo + chunk][valid] = total[valid] / width[valid]
+
+    return mean0
+
+
+def chromosome_features(fragments, bigwig, g_size, bin_size, cutoff):
+    # (frag_len, gc_mean, map_mean) of the bins of one chromosome
+    name = fragments["chroms"][0]
+    size = g_size.get(name, np.iinfo(np.int64).max)
+    start, end = fragment_ends(fragments["strand"], fragments["pos"], size, bin_size)
+    bw = pyBigWig.open(bigwig)
+    try:
+        mean0 = average_over_bed(bw, bigwig_chrom(name, bw.chroms()), start, end)
+    finally:
+        bw.close()
+    # the mappability goes through the text written by bigWigAverageOverBed
+    mappability = np.array(["%g" % x for x in mean0.tolist()], dtype=np.float64)
+
+    keep = mappability > cutoff
+    pos = fragments["pos"][keep]
+    chrom = np.zeros(pos.size, dtype=np.int64)
+    feature_frag2bin.check_fragments([name], chrom, pos, g_size)
+    nbins = int(g_size[name] / bin_size + 1) if name in g_size else 0
+
+    return feature_frag2bin.bin_features(
+        pos // bin_size, fragments["fraglen"][keep], fragments["gc"][keep], mappability[keep], nbins
+    )
+
+
+def worker_count(cores, max_memory, jobs):
+    # the digest of a chromosome holds about 8 bytes per base (the sequence, its lower
+    # case copy and the cumulative GC counts), so fewer workers run on large genomes
+    cores = max(min(cores, mp.cpu_count()), 1)
+    sizes = [job[1][3] - job[1][2] for job in jobs if job[0] == "fasta"]
+    if not max_memory or not sizes:
+        return cores
+    return max(min(cores, int(max_memory * 0.8) // (8 * max(sizes))), 1)
+
+
+def worker(job):
+    # features of one chromosome, and its fragments if they need to be kept
+    source, fragments, bigwig, g_size, bin_size, cutoff, keep = job
+    if source == "fasta":
+        fragments = digest.digest_chromosome(*fragments)
+        if fragments is None:
+            return None
+    return (
+        fragments["chroms"][0],
+        chromosome_features(fragments, bigwig, g_size, bin_size, cutoff),
+        fragments if keep else None,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Given a fasta file and a restricted recognition site, or the restriction fragments, "
+        "generate the genomic features of the bins for MAPS"
+    )
+    parser.add_argument("-f", "--fasta", dest="fasta", required=False, help="input fasta file")
+    parser.add_argument("-s", "--seq", dest="seq", required=False, help="RE cut sequence")
+    parser.add_argument("-p", "--pos", dest="pos", required=False, help="RE cut position")
+    parser.add_argument(
+        "--cut", dest="cut", required=False, help="RE cut file or binary fragment table (.npz), instead of the fasta"
+    )
+    parser.add_argument("-m", "--mappability", dest="mappability", required=True, help="mappability bigwig file")
+    parser.add_argument("-g", "--genome_size", dest="g_size", required=True, help="genome_size")
+    parser.add_argument("-b", "--bin_size", dest="bin_size", required=True, help="bin_size")
+    parser.add_argument(
+        "--cutoff",
+        dest="cutoff",
+        type=float,
+        default=0.5,
+        help="the fragments with a mappability not larger than the cutoff are dropped",
+    )
+    parser.add_argument("-o", "--output", dest="outfile", required=True, help="output file")
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        required=False,
+        help="Folder to keep the digests, keyed by the checksum of the fasta file, the sites and the MNase bin size",
+    )
+    parser.add_argument(
+        "-c", "--cores", dest="cores", default=1, type=int, required=False, help="number of cores for multiprocessing"
+    )
+    parser.add_argument(
+        "--max-memory",
+        dest="max_memory",
+        type=int,
+        required=False,
+        help="memory available in bytes, the number of workers digesting the fasta is bounded by it",
+    )
+    args = parser.parse_args()
+    if bool(args.cut) == bool(args.fasta):
+        parser.error("one of --cut and -f/--fasta is required")
+    if args.fasta and not (args.seq and args.pos):
+        parser.error("-s/--seq and -p/--pos are required with -f/--fasta")
+
+    bin_size = feature_frag2bin.parse_bin_size(args.bin_size)
+    g_size = feature_frag2bin.read_genome_size(args.g_size)
+    chroms, offsets = feature_frag2bin.genome_bins(g_size, bin_size)
+
+    table, cached = None, None
+    if args.cut:
+        table = read_cut(args.cut)
+    else:
+        mnase, seqs, sizes, poses = digest.parse_sites(args.seq, args.pos)
+        if args.cache_dir:
+            cached = digest.cache_path(args.cache_dir, args.fasta, mnase, seqs, poses, bin_size)
+            table = digest.load_cache(cached)
+    param = (args.mappability, g_size, bin_size, args.cutoff)
+    if table is not None:
+        jobs = [("table", fragments) + param + (False,) for fragments in split_table(table)]
+    elif args.fasta:
+        jobs = [
+            ("fasta", (args.fasta, name, start, end, mnase, seqs, sizes, poses, bin_size)) + param + (bool(cached),)
+            for name, start, end in digest.index_fasta(args.fasta)
+        ]
+    else:
+        jobs = []
+
+    frag_len = np.zeros(offsets[-1], dtype=np.int64)
+    gc_mean = np.zeros(offsets[-1])
+    map_mean = np.zeros(offsets[-1])
+    parts = []
+    pool = mp.Pool(worker_count(args.cores, args.max_memory, jobs))
+    for result in pool.imap(worker, jobs):
+        if result is None:
+            continue
+        name, features, fragments = result
+        if name in g_size:
+            lo = offsets[chroms.index(name)]
+            for total, value in zip((frag_len, gc_mean, map_mean), features):
+                total[lo : lo + value.size] = value
+        if fragments is not None:
+            parts.append(fragments)
+    pool.close()
+    pool.join()
+    if cached and parts:
+        digest.save_cache(cached, fragment_table.concatenate(parts))
+
+    with open(args.outfile, "w") as f:
+        feature_frag2bin.write_features(f, chroms, offsets, bin_size, frag_len, gc_mean, map_mean)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
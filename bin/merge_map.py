@@ -8,32 +8,245 @@
 # This source code is licensed under the GPL-3.0 license
 #########################################
 
+import io
+import os
 import sys
+import shutil
 import argparse
+import tempfile
+import itertools
+import numpy as np
+import pandas as pd
+import fragment_table
+
+
+class JoinStats:
+    def __init__(self):
+        self.merged = 0
+        self.missing = 0
+        self.examples = []
+
+    def miss(self, keys):
+        self.missing += len(keys)
+        self.examples.extend(keys[: 10 - len(self.examples)])
+
+    def report(self, mode):
+        sys.stderr.write("merged %d fragments with the %s join\n" % (self.merged, mode))
+        if self.missing:
+            sys.stderr.write(
+                "%d fragments cannot be found in mapability file and are skipped, e.g. %s\n"
+                % (self.missing, ", ".join(self.examples))
+            )
+
+
+def cut_key(line):
+    num, _, chrom = line.split("\t", 3)[:3]
+    return chrom + "_" + num
+
+
+def join_sorted(cut, mapability, fo, stats):
+    # stream both files in lockstep; return the first cut line whose fragment is not
+    # the next one of the mapability file, or None when the cut file is exhausted
+    for line in cut:
+        entry = mapability.readline()
+        key = cut_key(line)
+        tmp = entry.rstrip().split("\t")
+        if tmp[0] != key or len(tmp) < 5:
+            return line
+        fo.write(line.rstrip() + "\t" + tmp[4] + "\n")
+        stats.merged += 1
+
+    return None
+
+
+def map_chrom(line):
+    # chromosome of a line of the mapability file, whose first column is chr_fragid
+    return line.split(b"\t", 1)[0].rsplit(b"_", 1)[0]
+
+
+def index_mapability(path):
+    # byte range of the fragments of every chromosome in the mapability file, so the
+    # indexed join holds a single chromosome in memory; None if the fragments of a
+    # chromosome are not contiguous, the file being then split by split_mapability
+    blocks = {}
+    chrom, start, offset = None, 0, 0
+    with open(path, "rb") as f:
+        for line in f:
+            name = map_chrom(line)
+            if name != chrom:
+                if chrom is not None:
+                    blocks[chrom] = (path, start, offset)
+                if name in blocks:
+                    return None
+                chrom, start = name, offset
+            offset += len(line)
+    if chrom is not None:
+        blocks[chrom] = (path, start, offset)
+
+    return {name.decode(): block for name, block in blocks.items()}
+
+
+def split_mapability(path, tmpdir, max_bytes=64 << 20):
+    # one file per chromosome of the mapability file, in the order of the input; the lines
+    # are kept in memory up to max_bytes and then appended to the file of their chromosome
+    files, buffers = {}, {}
+    size = 0
+
+    def spill():
+        for name, lines in buffers.items():
+            with open(files[name], "ab") as out:
+                out.writelines(lines)
+        buffers.clear()
+
+    with open(path, "rb") as f:
+        for line in f:
+            name = map_chrom(line)
+            if name not in files:
+                files[name] = os.path.join(tmpdir, "{}.txt".format(len(files)))
+            buffers.setdefault(name, []).append(line)
+            size += len(line)
+            if size > max_bytes:
+                spill()
+                size = 0
+    spill()
+
+    return {name.decode(): (chrom_path, 0, os.path.getsize(chrom_path)) for name, chrom_path in files.items()}
+
+
+def load_mapability(block):
+    # mapability (as text) of the fragments of one chromosome, indexed by chr_fragid
+    path, start, end = block
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = io.BytesIO(f.read(end - start))
+    mapability = pd.read_csv(data, sep="\t", header=None, usecols=[0, 4], dtype=str, na_filter=False, index_col=0).iloc[
+        :, 0
+    ]
+    return mapability[~mapability.index.duplicated(keep="last")]
+
+
+class ChromosomeMapability:
+    # the mapability of the last chromosome looked up, read again when the chromosome changes;
+    # a mapability file whose chromosomes are interleaved is first split next to the output
+    def __init__(self, path, outfile):
+        self.tmpdir = None
+        self.blocks = index_mapability(path)
+        if self.blocks is None:
+            sys.stderr.write("the chromosomes of %s are interleaved, splitting it by chromosome\n" % path)
+            self.tmpdir = tempfile.mkdtemp(
+                prefix=os.path.basename(outfile) + ".", dir=os.path.dirname(os.path.abspath(outfile))
+            )
+            self.blocks = split_mapability(path, self.tmpdir)
+        self.chrom = None
+        self.mapability = None
+
+    def get(self, chrom):
+        if chrom != self.chrom:
+            # release the previous chromosome before reading the next one
+            self.mapability = None
+            block = self.blocks.get(chrom)
+            self.mapability = (
+                load_mapability(block) if block else pd.Series([], index=pd.Index([], dtype=str), dtype=str)
+            )
+            self.chrom = chrom
+        return self.mapability
+
+    def close(self):
+        if self.tmpdir is not None:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def lookup(mapability, keys, stats):
+    # mapability of the keys found, and the mask of those keys
+    idx = mapability.index.get_indexer(keys)
+    found = idx >= 0
+    if not found.all():
+        stats.miss([key for key, hit in zip(keys, found.tolist()) if not hit])
+    stats.merged += int(found.sum())
+
+    return mapability.values[idx[found]], found
+
+
+def join_chunked(lines, mapability, fo, stats, chunksize=1000000):
+    # vectorized lookup of the remaining cut lines, chunk by chunk and chromosome by chromosome
+    while True:
+        chunk = [line.rstrip() for line in itertools.islice(lines, chunksize)]
+        if not chunk:
+            break
+        for chrom, group in itertools.groupby(chunk, key=lambda line: line.split("\t", 3)[2]):
+            group = list(group)
+            values, found = lookup(mapability.get(chrom), [cut_key(line) for line in group], stats)
+            group = itertools.compress(group, found.tolist())
+            fo.write("".join(line + "\t" + value + "\n" for line, value in zip(group, values)))
+
+
+def join_table(args, stats):
+    table = fragment_table.load_table(args.cut)
+    names = table["chroms"].tolist()
+    values = np.empty(table["num"].size, dtype=object)
+    found = np.zeros(table["num"].size, dtype=bool)
+    with ChromosomeMapability(args.map, args.outfile) as mapability:
+        for c, name in enumerate(names):
+            rows = np.flatnonzero(table["chrom"] == c)
+            keys = [name + "_" + str(num) for num in table["num"][rows].tolist()]
+            values_chrom, found_chrom = lookup(mapability.get(name), keys, stats)
+            values[rows[found_chrom]] = values_chrom
+            found[rows] = found_chrom
+    values = values[found]
+    table = {key: value if key == "chroms" else value[found] for key, value in table.items()}
+    if fragment_table.is_table(args.outfile):
+        table["mappability"] = values.astype(np.float64)
+        fragment_table.save_table(args.outfile, table)
+    else:
+        # keep the mapability text as it is in the input
+        table["mappability"] = values
+        with open(args.outfile, "w") as fo:
+            fragment_table.write_text(fo, table)
 
 
 def main():
     parser = argparse.ArgumentParser(description="")
-    parser.add_argument("-c", "--cut", dest="cut", required=True, help="RE cut file")
+    parser.add_argument("-c", "--cut", dest="cut", required=True, help="RE cut file or binary fragment table (.npz)")
     parser.add_argument("-m", "--map", dest="map", required=True, help="mapability file")
-    parser.add_argument("-o", "--output", dest="outfile", required=True, help="output file")
+    parser.add_argument(
+        "-o", "--output", dest="outfile", required=True, help="output file, a binary fragment table if ending in .npz"
+    )
+    parser.add_argument(
+        "--unsorted",
+        dest="unsorted",
+        action="store_true",
+        help="do not try to stream the files in lockstep, the fragments are not in the same order",
+    )
     args = parser.parse_args()
+    if fragment_table.is_table(args.outfile) and not fragment_table.is_table(args.cut):
+        parser.error("a binary output table requires a binary fragment table as input")
 
-    mapability = {}
-    with open(args.map, "r") as f:
-        for line in f:
-            tmp = line.rstrip().split("\t")
-            mapability[tmp[0]] = tmp[4]
+    stats = JoinStats()
+    if fragment_table.is_table(args.cut):
+        join_table(args, stats)
+        stats.report("indexed")
+        return
 
+    mode = "sorted"
     with open(args.outfile, "w") as fo:
         with open(args.cut, "r") as f:
-            for line in f:
-                tmp = line.rstrip().split("\t")
-                key = tmp[2] + "_" + tmp[0]
-                try:
-                    fo.write("%s\n" % "\t".join([str(i) for i in tmp + [mapability[key]]]))
-                except KeyError:
-                    sys.exit("Frag %s cannot be found in mapability file." % key)
+            rest = f
+            if not args.unsorted:
+                with open(args.map, "r") as m:
+                    line = join_sorted(f, m, fo, stats)
+                rest = None if line is None else itertools.chain([line], f)
+            # fall back to the indexed join as soon as the orders diverge
+            if rest is not None:
+                mode = "sorted and indexed" if stats.merged else "indexed"
+                with ChromosomeMapability(args.map, args.outfile) as mapability:
+                    join_chunked(rest, mapability, fo, stats)
+    stats.report(mode)
 
 
 if __name__ == "__main__":
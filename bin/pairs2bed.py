@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+#########################################
+# File: pairs2bed.py
+# Extract the R1 or R2 reads of a pairs file as a sorted bed file, e.g. for R2
+#   gunzip -c pairs.gz | awk '{print $4, $5, $5+1, "*", "0", $7}' | sort -k1,1 -k2,2n | uniq
+# optionally with the Tn5 insertion shifted by +4/-5, and with or without the
+# duplicated reads. The reads are parsed in chunks, and every chromosome is
+# sorted, formatted and compressed (BGZF) by a pool of processes.
+# If the pairs file is sorted by the chromosome of the read (#sorted: chr1-...
+# for R1), each chromosome is processed as soon as all its reads are parsed, and
+# the sort only merges the runs of positions already sorted. Otherwise the reads
+# are distributed to one bucket per chromosome, spilled to disk once they exceed
+# the memory limit, and the chromosomes are processed at the end.
+# The number of pairs read is printed to stdout.
+# This source code is licensed under the MIT license
+#########################################
+
+import os
+import sys
+import gzip
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import multiprocessing as mp
+import bgzf
+
+# binary record of a read in the buckets, strand is the index into the strand names
+RECORD = np.dtype([("pos", "<i8"), ("strand", "u1")])
+# columns of chrom, pos and strand of each read in the pairs file
+READ_COLUMNS = {"1": [1, 2, 5], "2": [3, 4, 6]}
+# reads formatted as text and compressed at a time by sort_chromosome
+FORMAT_CHUNK = 100000
+
+
+def read_header(path):
+    # number of header lines, and the sort order of the pairs, e.g. ["chr1", "chr2", "pos1", "pos2"]
+    n, order = 0, []
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            if line.startswith("#sorted:"):
+                order = line.split(":", 1)[1].strip().split("-")
+            n += 1
+
+    return n, order
+
+
+class Buckets:
+    # reads of each chromosome, kept in memory up to max_bytes and then appended to
+    # one file per chromosome
+    def __init__(self, tmpdir, max_bytes):
+        self.tmpdir = tmpdir
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.chroms = {}
+        self.buffers = {}
+
+    def add(self, chrom, records):
+        if chrom not in self.chroms:
+            self.chroms[chrom] = os.path.join(self.tmpdir, "{}.bin".format(len(self.chroms)))
+            self.buffers[chrom] = []
+        self.buffers[chrom].append(records)
+        self.size += records.nbytes
+        if self.size > self.max_bytes:
+            self.spill()
+
+    def spill(self):
+        for chrom, buffer in self.buffers.items():
+            if buffer:
+                with open(self.chroms[chrom], "ab") as f:
+                    for records in buffer:
+                        records.tofile(f)
+                self.buffers[chrom] = []
+        self.size = 0
+
+    def pop(self, chrom):
+        # path of the spilled reads and the reads in memory of a chromosome
+        self.size -= sum(records.nbytes for records in self.buffers[chrom])
+        return self.chroms[chrom], self.buffers.pop(chrom)
+
+
+def read_pairs(path, columns, skiprows, shift, chunksize):
+    # chunks of (chrom, pos, strand) of the reads, shifted if requested
+    chrom_col, pos_col, strand_col = columns
+    try:
+        reader = pd.read_csv(
+            path,
+            sep="\t",
+            header=None,
+            usecols=columns,
+            dtype={chrom_col: str, pos_col: np.int64, strand_col: str},
+            skiprows=skiprows,
+            compression="gzip",
+            chunksize=chunksize,
+        )
+    except pd.errors.EmptyDataError:
+        return
+    for chunk in reader:
+        pos = chunk[pos_col].values
+        strand = chunk[strand_col].values
+        if shift:
+            pos = pos + np.where(strand == "+", 4, np.where(strand == "-", -5, 0))
+        yield chunk[chrom_col].values, pos, strand
+
+
+def sort_chromosome(job):
+    # write the sorted (and deduplicated) reads of one chromosome as BGZF blocks to outfile
+    chrom, path, buffer, strands, score, unique, outfile = job
+    parts = list(buffer)
+    if os.path.exists(path):
+        parts.insert(0, np.fromfile(path, dtype=RECORD))
+        os.remove(path)
+    records = np.concatenate(parts)
+    del parts
+    # the strand names are ranked as bytes, as the whole line is the last key of sort
+    rank = np.argsort(np.argsort([s.encode() for s in strands])).astype(np.int64)
+    key = records["pos"] * 256 + rank[records["strand"]]
+    del records
+    if key.size and not (key[1:] >= key[:-1]).all():
+        # timsort, the runs of sorted positions are merged
+        key = key[np.argsort(key, kind="stable")]
+    if unique:
+        key = key[np.r_[True, key[1:] != key[:-1]]]
+    pos, strand = key >> 8, key & 255
+
+    names = sorted(strands, key=lambda s: s.encode())
+    prefix = chrom + "\t"
+    suffix = ["\t*\t" + score + "\t" + s + "\n" for s in names]
+    with open(outfile, "wb") as f:
+        # the lines are formatted and compressed FORMAT_CHUNK reads at a time, the bytes
+        # short of a full block being carried over, so the blocks are those of the whole text
+        rest = b""
+        for i in range(0, pos.size, FORMAT_CHUNK):
+            lines = "".join(
+                [
+                    prefix + str(p) + "\t" + str(p + 1) + suffix[s]
+                    for p, s in zip(pos[i : i + FORMAT_CHUNK].tolist(), strand[i : i + FORMAT_CHUNK].tolist())
+                ]
+            )
+            text = rest + lines.encode()
+            full = len(text) // bgzf.BLOCK_SIZE * bgzf.BLOCK_SIZE
+            f.write(bgzf.compress(text[:full]))
+            rest = text[full:]
+        f.write(bgzf.compress(rest))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the R1 or R2 reads of a pairs file as a sorted bed file")
+    parser.add_argument("-i", "--input", dest="pairs", required=True, help="input pairs file (.pairs.gz)")
+    parser.add_argument("-o", "--output", dest="outfile", required=True, help="output bed file (.bed.gz)")
+    parser.add_argument("-r", "--read", dest="read", choices=["1", "2"], default="2", help="read to extract")
+    parser.add_argument(
+        "-s", "--shift", dest="shift", action="store_true", help="shift the reads by +4 on + strand and -5 on - strand"
+    )
+    parser.add_argument("--score", dest="score", default="0", help="score column of the bed file")
+    parser.add_argument(
+        "--keep-duplicates", dest="unique", action="store_false", help="keep the duplicated reads, as sort without uniq"
+    )
+    parser.add_argument(
+        "-t", "--threads", dest="threads", default=1, type=int, help="number of processes to sort and compress"
+    )
+    parser.add_argument(
+        "-m", "--memory", dest="memory", default=2048, type=int, help="memory for the reads, in Mb, before spilling"
+    )
+    parser.add_argument("--chunksize", dest="chunksize", default=1000000, type=int, help="lines read at a time")
+    args = parser.parse_args()
+
+    skiprows, sort_order = read_header(args.pairs)
+    # the reads of a chromosome are contiguous if the pairs are sorted by its chromosome first
+    grouped = bool(sort_order) and sort_order[0] == "chr" + args.read
+    sys.stderr.write(
+        "pairs sorted by {}, {} the chromosomes\n".format(
+            "-".join(sort_order) or "nothing", "streaming" if grouped else "bucketing"
+        )
+    )
+
+    tmpdir = tempfile.mkdtemp(
+        prefix=os.path.basename(args.outfile) + ".", dir=os.path.dirname(os.path.abspath(args.outfile))
+    )
+    pool = mp.Pool(max(args.threads, 1))
+    try:
+        buckets = Buckets(tmpdir, args.memory << 20)
+        strands = {}
+        count = 0
+        # chromosomes sent to the pool, and the chromosome being read if the pairs are grouped
+        done, current, results = set(), None, {}
+
+        def submit(chrom, strand_names):
+            path, buffer = buckets.pop(chrom)
+            done.add(chrom)
+            part = os.path.join(tmpdir, "{}.bed.gz".format(len(done)))
+            job = (chrom, path, buffer, strand_names, args.score, args.unique, part)
+            results[chrom] = (part, pool.apply_async(sort_chromosome, (job,)))
+
+        for chrom, pos, strand in read_pairs(args.pairs, READ_COLUMNS[args.read], skiprows, args.shift, args.chunksize):
+            count += pos.size
+            strand_codes, strand_names = pd.factorize(strand)
+            for name in strand_names:
+                strands.setdefault(name, len(strands))
+            strand_codes = np.array([strands[name] for name in strand_names], dtype=np.uint8)[strand_codes]
+            chrom_codes, chrom_names = pd.factorize(chrom)
+            order = np.argsort(chrom_codes, kind="mergesort")
+            bounds = np.searchsorted(chrom_codes[order], np.arange(len(chrom_names) + 1))
+            for c, name in enumerate(chrom_names):
+                if grouped:
+                    if name in done:
+                        sys.exit(
+                            "The reads of {} are not contiguous, the pairs are not sorted by chr{}.".format(
+                                name, args.read
+                            )
+                        )
+                    if current is not None and name != current:
+                        # the strand names seen so far, the ones of the finished chromosome are known
+                        submit(current, sorted(strands, key=strands.get))
+                    current = name
+                rows = order[bounds[c] : bounds[c + 1]]
+                records = np.empty(rows.size, dtype=RECORD)
+                records["pos"] = pos[rows]
+                records["strand"] = strand_codes[rows]
+                buckets.add(name, records)
+
+        strand_names = sorted(strands, key=strands.get)
+        for chrom in list(buckets.buffers):
+            submit(chrom, strand_names)
+        with bgzf.Writer(args.outfile) as out:
+            for chrom in sorted(results, key=lambda c: c.encode()):
+                part, result = results.pop(chrom)
+                result.get()
+                out.append(part)
+                os.remove(part)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    print(count)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,10 +6,12 @@
 ## This source code is licensed under the MIT license
 ## changes:
 ## handle the errors when allpossible_sumcount==0 in calculate_contact_probability
+## optional profile of the stages (--profile)
 ######################################################
 import pypairix
 import math
 import os
+import profiling
 
 SEPARATOR = "|"
 CIS_TRANS_OUT_FILE_SUFFIX = "cis_to_trans.out"
@@ -264,6 +266,8 @@ def cis_trans_ratio(pairs_file, outfilename, DIST_THRES=20000, cols=cols_pairs):
                     cts.cis_short += 1
         else:
             cts.trans += sum(1 for x in it)
+    profiling.count("cis_pairs", cts.cis + cts.cis_short)
+    profiling.count("trans_pairs", cts.trans)
     cts.calculate_total()
     cts.calculate_cis_to_trans()
     cts.calculate_percent_long_range_intra()
@@ -300,6 +304,7 @@ def distance_histogram(
     chrplist = tb.get_blocknames()
 
     # calculate histogram
+    profiling.stage("distance_scan")
     for chrp in chrplist:
         chr1, chr2 = chrp.split(SEPARATOR)
         if chr1 == chr2:
@@ -316,6 +321,7 @@ def distance_histogram(
                         ss[bin_number].increment(orientation, chr1)
 
     # calculate total
+    profiling.stage("contact_probability")
     for bin_number in bins.range:
         ss[bin_number].calculate_sumcount()
 
@@ -333,6 +339,7 @@ def distance_histogram(
         ss[bin_number].calculate_contact_probability(bin_mid, bin_size)
 
     # print histogram
+    profiling.stage("write")
     with open(outfilename, "w") as f:
         ss[0].print_header(f)
         for bin_number in bins.range:
@@ -359,6 +366,7 @@ if __name__ == "__main__":
         "--max_logdistance",
         help="Maximum log distance. This number should not be larger than all chromosomes. Choose 8.2 for mouse. Default 8.4 (human).",
     )
+    profiling.add_argument(parser)
     args = parser.parse_args()
 
     if args.outdir_prefix:
@@ -397,7 +405,10 @@ if __name__ == "__main__":
     else:
         max_logdist = 8.4
 
+    profiling.setup(args.profile, outdir + "/" + sample_name)
+
     # get the stats
+    profiling.stage("cis_trans")
     cis_trans_ratio(args.pairs, outfilename=CIS_TRANS_OUT_FILE_PATH, cols=cols)
     distance_histogram(
         args.pairs,
@@ -407,3 +418,4 @@ if __name__ == "__main__":
         orientation_list=orientation_list,
         max_logdistance=max_logdist,
     )
+    profiling.stage(None)
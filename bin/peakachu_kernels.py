@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+#########################################
+# File: peakachu_kernels.py
+# Numba kernels of peakachu_score_genome.py, kept in their own module so the
+# scoring script only imports and compiles numba when it scores a chromosome.
+# The kernels are compiled with cache=True: the machine code is saved under
+# $NUMBA_CACHE_DIR (or __pycache__ next to this file) and reused by the later
+# processes. warmup() compiles every kernel for the argument types used by the
+# scoring, e.g. once when the container is built:
+#   peakachu_score_genome.py --warmup --numba-cache /opt/numba_cache
+# Kernels copied from https://github.com/tariks/peakachu/commit/adc736627bf43451aa1eee8ece061f3d57bc0c64
+# This source code is licensed under the MIT license
+#########################################
+
+import numpy as np
+from numba import njit, prange
+
+
+@njit(cache=True)
+def distance_normaize_core(sub, exp_bychrom, x, y, w):
+    # calculate x and y indices
+    x_arr = np.arange(x - w, x + w + 1).reshape((2 * w + 1, 1))
+    y_arr = np.arange(y - w, y + w + 1)
+
+    D = y_arr - x_arr
+    D = np.abs(D)
+    min_dis = D.min()
+    max_dis = D.max()
+    if max_dis >= exp_bychrom.size:
+        return sub
+    else:
+        exp_sub = np.zeros(sub.shape)
+        for d in range(min_dis, max_dis + 1):
+            xi, yi = np.where(D == d)
+            for i, j in zip(xi, yi):
+                exp_sub[i, j] = exp_bychrom[d]
+
+        normed = sub / exp_sub
+
+        return normed
+
+
+@njit(cache=True)
+def image_normalize(arr_2d):
+    arr_2d = (arr_2d - arr_2d.min()) / (arr_2d.max() - arr_2d.min())  # value range: [0,1]
+
+    return arr_2d
+
+
+@njit(cache=True)
+def distance_normalize(arr_pool, exp_bychrom, xi, yi, w):
+    clist = []
+    fea = []
+    for i in range(xi.size):
+        x = xi[i]
+        y = yi[i]
+        window = arr_pool[i]
+
+        bad_x, bad_y = np.where(np.isnan(window))
+        for i_, j_ in zip(bad_x, bad_y):
+            window[i_, j_] = 0
+
+        if np.count_nonzero(window) < window.size * 0.1:
+            continue
+
+        ll_mean = window[:w, :w].mean()
+        if ll_mean > 0:
+            center = window[w, w]
+            p2LL = center / ll_mean
+            if p2LL > 0.1:
+                window = distance_normaize_core(window, exp_bychrom, x, y, w)
+                fea.append(window)
+                clist.append((x, y))
+
+    return fea, clist
+
+
+@njit(parallel=True, cache=True)
+def forest_predict_core(X, roots, feature, threshold, left, right, value):
+    prob = np.zeros(X.shape[0])
+    for i in prange(X.shape[0]):
+        acc = 0.0
+        for t in range(roots.size):
+            node = roots[t]
+            while left[node] >= 0:
+                if X[i, feature[node]] <= threshold[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            acc += value[node]
+        prob[i] = acc / roots.size
+
+    return prob
+
+
+def warmup(width=5):
+    # compile the kernels for the types given by Chromosome.getwindow and CompiledForest,
+    # the node arrays of the forest being writable when converted and read-only when
+    # memory-mapped from the model cache
+    size = 2 * width + 1
+    coords = np.array([2 * size], dtype=np.int64)
+    distance_normalize(np.ones((1, size, size)), np.ones(4 * size), coords, coords + width, width)
+    image_normalize(np.arange(size * size, dtype=float).reshape((size, size)))
+
+    X = np.zeros((1, size * size), dtype=np.float32)
+    for writeable in (True, False):
+        # a single tree of a single leaf
+        roots, feature = np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        left, right = np.full(1, -1, dtype=np.int64), np.full(1, -1, dtype=np.int64)
+        threshold, value = np.zeros(1), np.ones(1)
+        for arr in (roots, feature, threshold, left, right, value):
+            arr.flags.writeable = writeable
+        forest_predict_core(X, roots, feature, threshold, left, right, value)
@@ -2,55 +2,109 @@
 
 # file copied data: https://github.com/tariks/peakachu/commit/adc736627bf43451aa1eee8ece061f3d57bc0c64
 # This source code is licensed under the MIT license
-import struct, io, os, joblib, argparse, sys
+import struct, io, os, argparse, sys, hashlib, json, shutil
 import numpy as np
-from sklearn.isotonic import IsotonicRegression
-from scipy import sparse
-from scipy import stats
-from scipy.ndimage import gaussian_filter
-from numba import njit
 from collections import defaultdict
-import cooler
+import profiling
+
+# scipy, sklearn, joblib, cooler and numba are imported by the functions using them,
+# so --help, --warmup and the tasks without work do not pay for their import
 
 
 def tocsr(X):
+    from scipy import sparse
+
     row, col, data = X.row, X.col, X.data
     M = sparse.csr_matrix((data, (row, col)), shape=X.shape, dtype=float)
 
     return M
 
 
-def calculate_expected(M, maxdis, raw=False):
+def fetch_banded(clr, chrom, maxdis, width, balance=False, chunksize=5000000):
+    # stream the cis pixels of one chromosome in chunks and keep only those
+    # within `maxdis` diagonals (mirroring the first 2*width into the lower
+    # triangle); balanced values are derived from the raw counts on the fly.
+    # `valid_cols` marks the bins with at least one valid pixel on the whole
+    # chromosome, the band being cut only after: with balance, a pixel is valid
+    # when both its bins have a weight in the bins table
+    from scipy import sparse
+
+    lo, hi = clr.extent(chrom)
+    n = hi - lo
+    weights = None
+    valid_cols = np.zeros(n, dtype=bool)
+    rows, cols, counts = [], [], []
+    with clr.open("r") as h5:
+        if balance:
+            weights = h5["bins/weight"][lo:hi]
+            if h5["bins/weight"].attrs.get("divisive_weights", False):
+                weights = 1 / weights
+            # the bins masked by the balancing have no weight
+            weighted = np.isfinite(weights)
+        p_lo, p_hi = h5["indexes/bin1_offset"][[lo, hi]]
+        pixels = h5["pixels"]
+        for start in range(p_lo, p_hi, chunksize):
+            end = min(start + chunksize, p_hi)
+            bin1 = pixels["bin1_id"][start:end] - lo
+            bin2 = pixels["bin2_id"][start:end] - lo
+            count = pixels["count"][start:end]
+            cis = bin2 < n
+            bin1, bin2, count = bin1[cis], bin2[cis], count[cis]
+            if balance:
+                valid = weighted[bin1] & weighted[bin2]
+            else:
+                valid = count > 0
+            valid_cols[bin1[valid]] = True
+            valid_cols[bin2[valid]] = True
+
+            dis = bin2 - bin1
+            inband = dis <= maxdis
+            mirror = (dis > 0) & (dis < 2 * width)
+            rows.extend([bin1[inband], bin2[mirror]])
+            cols.extend([bin2[inband], bin1[mirror]])
+            counts.extend([count[inband], count[mirror]])
+
+    R = np.concatenate(rows) if rows else np.array([], dtype=int)
+    C = np.concatenate(cols) if cols else np.array([], dtype=int)
+    data = np.concatenate(counts).astype(float) if counts else np.array([], dtype=float)
+    raw_M = sparse.csr_matrix((data, (R, C)), shape=(n, n), dtype=float)
+    if balance:
+        M = sparse.csr_matrix((weights[R] * weights[C] * data, (R, C)), shape=(n, n), dtype=float)
+    else:
+        M = raw_M
+
+    return M, raw_M, weights, valid_cols
+
+
+def calculate_expected(M, maxdis, raw=False, valid_cols=None):
+    from sklearn.isotonic import IsotonicRegression
+
     n = M.shape[0]
-    R, C = M.nonzero()
+    M = M.tocoo()
     valid_pixels = np.isfinite(M.data)
+    R, C, data = M.row[valid_pixels], M.col[valid_pixels], M.data[valid_pixels]
     # extract valid columns
-    if raw:
-        R, C, data = R[valid_pixels], C[valid_pixels], M.data[valid_pixels]
-        M = sparse.csr_matrix((data, (R, C)), shape=M.shape, dtype=float)
-        marg = np.array(M.sum(axis=0)).ravel()
-        valid_cols = marg > 0
-    else:
-        R, C = set(R[valid_pixels]), set(C[valid_pixels])
-        valid_cols = np.zeros(n, dtype=bool)
-        for i in R:
-            valid_cols[i] = True
-        for i in C:
-            valid_cols[i] = True
+    if valid_cols is None:
+        if raw:
+            valid_cols = np.bincount(C, weights=data, minlength=n) > 0
+        else:
+            valid_cols = np.zeros(n, dtype=bool)
+            valid_cols[R] = True
+            valid_cols[C] = True
+
+    # sum every diagonal in a single pass over the pixels
+    D = C - R
+    mask = (D >= 0) & (D <= maxdis) & valid_cols[R] & valid_cols[C]
+    diag_sum = np.bincount(D[mask], weights=data[mask], minlength=maxdis + 1)
+    # number of valid bin pairs at each genomic distance
+    diag_size = np.zeros(maxdis + 1, dtype=int)
+    for i in range(min(maxdis + 1, n)):
+        diag_size[i] = np.count_nonzero(valid_cols[: n - i] & valid_cols[i:])
 
     # calculate the expected value for each genomic distance
     exp_arr = np.zeros(maxdis + 1)
-    for i in range(maxdis + 1):
-        if i == 0:
-            valid = valid_cols
-        else:
-            valid = valid_cols[:-i] * valid_cols[i:]
-
-        diag = M.diagonal(i)
-        diag = diag[valid]
-        if diag.size > 10:
-            exp = diag.mean()
-            exp_arr[i] = exp
+    enough = diag_size > 10
+    exp_arr[enough] = diag_sum[enough] / diag_size[enough]
 
     # make exp_arr stringently non-increasing
     IR = IsotonicRegression(increasing=False, out_of_bounds="clip")
@@ -61,78 +115,147 @@ def calculate_expected(M, maxdis, raw=False):
     return exp_arr
 
 
-@njit
-def distance_normaize_core(sub, exp_bychrom, x, y, w):
-    # calculate x and y indices
-    x_arr = np.arange(x - w, x + w + 1).reshape((2 * w + 1, 1))
-    y_arr = np.arange(y - w, y + w + 1)
-
-    D = y_arr - x_arr
-    D = np.abs(D)
-    min_dis = D.min()
-    max_dis = D.max()
-    if max_dis >= exp_bychrom.size:
-        return sub
-    else:
-        exp_sub = np.zeros(sub.shape)
-        for d in range(min_dis, max_dis + 1):
-            xi, yi = np.where(D == d)
-            for i, j in zip(xi, yi):
-                exp_sub[i, j] = exp_bychrom[d]
-
-        normed = sub / exp_sub
-
-        return normed
-
-
-@njit
-def image_normalize(arr_2d):
-    arr_2d = (arr_2d - arr_2d.min()) / (arr_2d.max() - arr_2d.min())  # value range: [0,1]
-
-    return arr_2d
-
-
-@njit
-def distance_normalize(arr_pool, exp_bychrom, xi, yi, w):
-    clist = []
-    fea = []
-    for i in range(xi.size):
-        x = xi[i]
-        y = yi[i]
-        window = arr_pool[i]
-
-        bad_x, bad_y = np.where(np.isnan(window))
-        for i_, j_ in zip(bad_x, bad_y):
-            window[i_, j_] = 0
-
-        if np.count_nonzero(window) < window.size * 0.1:
-            continue
-
-        ll_mean = window[:w, :w].mean()
-        if ll_mean > 0:
-            center = window[w, w]
-            p2LL = center / ll_mean
-            if p2LL > 0.1:
-                window = distance_normaize_core(window, exp_bychrom, x, y, w)
-                fea.append(window)
-                clist.append((x, y))
+class CompiledForest:
+    # flatten the trees of a fitted sklearn forest classifier into shared
+    # node arrays, evaluated in batch by forest_predict_core
+    fields = ["roots", "feature", "threshold", "left", "right", "value"]
+
+    def __init__(self, roots, feature, threshold, left, right, value, n_features):
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.n_features = n_features
+
+    @classmethod
+    def from_model(cls, model):
+        trees = [est.tree_ for est in model.estimators_]
+        sizes = np.array([t.node_count for t in trees])
+        offsets = np.r_[0, np.cumsum(sizes)[:-1]]
+        left = np.concatenate([np.where(t.children_left < 0, -1, t.children_left + o) for t, o in zip(trees, offsets)])
+        right = np.concatenate(
+            [np.where(t.children_right < 0, -1, t.children_right + o) for t, o in zip(trees, offsets)]
+        )
+        # probability of the positive class at every node
+        value = np.concatenate([t.value[:, 0, :] for t in trees]).astype(np.float64)
+        normalizer = value.sum(axis=1)
+        normalizer[normalizer == 0] = 1
+
+        return cls(
+            roots=offsets.astype(np.int64),
+            feature=np.concatenate([t.feature for t in trees]).astype(np.int64),
+            threshold=np.concatenate([t.threshold for t in trees]).astype(np.float64),
+            left=left.astype(np.int64),
+            right=right.astype(np.int64),
+            value=value[:, list(model.classes_).index(1)] / normalizer,
+            n_features=model.feature_importances_.size,
+        )
 
-    return fea, clist
+    def save(self, folder):
+        # write into a private folder first so concurrent tasks never see a partial cache
+        tmp = "{}.{}.tmp".format(folder, os.getpid())
+        os.makedirs(tmp)
+        for field in self.fields:
+            np.save(os.path.join(tmp, field + ".npy"), getattr(self, field))
+        with open(os.path.join(tmp, "meta.json"), "w") as out:
+            json.dump({"n_features": int(self.n_features)}, out)
+        try:
+            os.rename(tmp, folder)
+        except OSError:
+            shutil.rmtree(tmp)
+
+    @classmethod
+    def load(cls, folder):
+        with open(os.path.join(folder, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {field: np.load(os.path.join(folder, field + ".npy"), mmap_mode="r") for field in cls.fields}
+
+        return cls(n_features=meta["n_features"], **arrays)
+
+    def predict_proba(self, X):
+        # sklearn trees compare features in single precision
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        from peakachu_kernels import forest_predict_core
+
+        p = forest_predict_core(X, self.roots, self.feature, self.threshold, self.left, self.right, self.value)
+
+        return np.c_[1 - p, p]
+
+
+def file_checksum(path, blocksize=1 << 20):
+    md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(blocksize), b""):
+            md5.update(chunk)
+
+    return md5.hexdigest()
+
+
+def load_model(path, backend="compiled", threads=1, cache=None):
+    # return the inference engine and the number of features it expects;
+    # compiled forests are cached by the checksum of the pickled model
+    def set_num_threads():
+        # numba is only needed by the compiled forests, and refuses more threads than it can launch
+        import numba
+
+        numba.set_num_threads(max(min(threads, numba.config.NUMBA_NUM_THREADS), 1))
+
+    folder = None
+    if backend == "compiled" and cache:
+        folder = os.path.join(cache, file_checksum(path))
+        if os.path.exists(os.path.join(folder, "meta.json")):
+            set_num_threads()
+            forest = CompiledForest.load(folder)
+            return forest, forest.n_features
+
+    import joblib
+
+    model = joblib.load(path)
+    n_features = model.feature_importances_.size
+    if backend == "compiled" and all(hasattr(est, "tree_") for est in getattr(model, "estimators_", [None])):
+        set_num_threads()
+        model = CompiledForest.from_model(model)
+        if folder:
+            try:
+                os.makedirs(cache, exist_ok=True)
+                model.save(folder)
+            except OSError as e:
+                print("can not write model cache {}: {}".format(folder, e))
+    elif hasattr(model, "n_jobs"):
+        model.set_params(n_jobs=threads)
+
+    return model, n_features
 
 
 class Chromosome:
-    def __init__(self, M, model, raw_M=None, weights=None, lower=6, upper=300, cname="chrm", res=10000, width=5):
+    def __init__(
+        self,
+        M,
+        model,
+        raw_M=None,
+        weights=None,
+        valid_cols=None,
+        lower=6,
+        upper=300,
+        cname="chrm",
+        res=10000,
+        width=5,
+    ):
+        from scipy import sparse
+
         lower = max(lower, width + 1)
         upper = min(upper, M.shape[0] - 2 * width)
         # calculate expected values
         if weights is None:
-            self.exp_arr = calculate_expected(M, upper + 2 * width, raw=True)
+            self.exp_arr = calculate_expected(M, upper + 2 * width, raw=True, valid_cols=valid_cols)
             if M is raw_M:
                 self.background = self.exp_arr
             else:
                 self.background = calculate_expected(raw_M, upper + 2 * width, raw=True)
         else:
-            self.exp_arr = calculate_expected(M, upper + 2 * width, raw=False)
+            self.exp_arr = calculate_expected(M, upper + 2 * width, raw=False, valid_cols=valid_cols)
             self.background = self.exp_arr
 
         self.raw_M = raw_M
@@ -150,6 +273,8 @@ class Chromosome:
         self.model = model
 
     def get_candidate(self, lower, upper):
+        from scipy import stats
+
         x_arr = np.array([], dtype=int)
         y_arr = np.array([], dtype=int)
         p_arr = np.array([], dtype=float)
@@ -179,6 +304,9 @@ class Chromosome:
         self.ridx, self.cidx = x_arr[mask], y_arr[mask]
 
     def getwindow(self, coords):
+        from scipy.ndimage import gaussian_filter
+        from peakachu_kernels import distance_normalize, image_normalize
+
         w = self.w
         coords = np.r_[coords]
         xi, yi = coords[:, 0], coords[:, 1]
@@ -203,6 +331,8 @@ class Chromosome:
         return fea, clist
 
     def score(self, thre=0.5):
+        from scipy import sparse
+
         print("scoring matrix {}".format(self.chromname))
         print("number of candidates {}".format(self.ridx.size))
         total_coords = [(r, c) for r, c in zip(self.ridx, self.cidx)]
@@ -361,7 +491,7 @@ def getargs():
 def parse_args(args=None):
     parser = argparse.ArgumentParser()
     parser.add_argument("-r", "--resolution", help="Resolution in bp (default 10000)", type=int, default=10000)
-    parser.add_argument("-p", "--path", help="Path to a .cool URI string or file.")
+    parser.add_argument("-p", "--path", nargs="+", help="Path(s) to .cool URI strings or files.")
     parser.add_argument("--balance", action="store_true", help="""Whether or not using the ICE/KR-balanced matrix.""")
     parser.add_argument(
         "-C",
@@ -386,25 +516,49 @@ def parse_args(args=None):
         default=0.5,
         help="""Only output pixels with probability score greater than this value (default 0.5)""",
     )
-    parser.add_argument("-O", "--output", help="Output file name.")
-
-    return parser.parse_args(args)
+    parser.add_argument(
+        "--backend",
+        choices=["compiled", "sklearn"],
+        default="compiled",
+        help="""Inference engine: "compiled" evaluates the flattened forest with numba, "sklearn" uses predict_proba.""",
+    )
+    parser.add_argument("-t", "--threads", type=int, default=1, help="""Number of threads used for inference.""")
+    parser.add_argument(
+        "--model-cache",
+        help="""Folder to keep the compiled model, keyed by the checksum of the pickled model file.""",
+    )
+    parser.add_argument(
+        "--numba-cache",
+        default=os.environ.get("NUMBA_CACHE_DIR"),
+        help="""Folder to keep the numba kernels compiled by the first run for the later runs (default $NUMBA_CACHE_DIR).""",
+    )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="""Compile the numba kernels into --numba-cache and exit, e.g. when building the container.""",
+    )
+    parser.add_argument("-O", "--output", nargs="+", help="Output file name(s), one per input path.")
+    profiling.add_argument(parser)
 
+    args = parser.parse_args(args)
+    if args.warmup:
+        return args
+    if not args.path or not args.model or not args.output:
+        parser.error("--path, --model and --output are required")
+    if len(args.path) != len(args.output):
+        parser.error("the number of --output files must match the number of --path inputs")
 
-def main(args=None):
-    args = parse_args(args)
-    np.seterr(divide="ignore", invalid="ignore")
+    return args
 
-    if os.path.exists(args.output):
-        os.remove(args.output)
 
-    model = joblib.load(args.model)
+def score_genome(path, output, model, width, args):
+    if os.path.exists(output):
+        os.remove(output)
 
-    # deduce the width parameter used during the training
-    width = int((np.sqrt(model.feature_importances_.size) - 1) / 2)
+    import cooler
 
     # not support .hic
-    Lib = cooler.Cooler(args.path)
+    Lib = cooler.Cooler(path)
     chromosomes = Lib.chromnames[:]
 
     queue = []
@@ -419,37 +573,54 @@ def main(args=None):
         else:
             cname = "chr" + key
 
-        if args.balance:
-            M = tocsr(Lib.matrix(balance=args.balance, sparse=True).fetch(key))
-            raw_M = tocsr(Lib.matrix(balance=False, sparse=True).fetch(key))
-            weights = Lib.bins().fetch(key)["weight"].values
+        # only the diagonals used for expected values and windows are loaded
+        with profiling.span("load"):
+            M, raw_M, weights, valid_cols = fetch_banded(Lib, key, args.upper + 2 * width, width, balance=args.balance)
+        profiling.count("pixels", M.nnz)
+        with profiling.span("candidates"):
             X = Chromosome(
                 M,
                 model=model,
                 raw_M=raw_M,
                 weights=weights,
+                valid_cols=valid_cols,
                 cname=cname,
                 lower=args.lower,
                 upper=args.upper,
                 res=args.resolution,
                 width=width,
             )
-        else:
-            M = tocsr(Lib.matrix(balance=False, sparse=True).fetch(key))
-            X = Chromosome(
-                M,
-                model=model,
-                raw_M=M,
-                weights=None,
-                cname=cname,
-                lower=args.lower,
-                upper=args.upper,
-                res=args.resolution,
-                width=width,
-            )
+        profiling.count("candidates", X.ridx.size)
+
+        with profiling.span("score"):
+            result, R = X.score(thre=args.minimum_prob)
+        profiling.count("loops", result.nnz)
+        with profiling.span("write"):
+            X.writeBed(output, result, R)
+
+
+def main(args=None):
+    args = parse_args(args)
+    if args.numba_cache:
+        # read by numba when it is first imported
+        os.environ["NUMBA_CACHE_DIR"] = args.numba_cache
+    if args.warmup:
+        import peakachu_kernels
+
+        peakachu_kernels.warmup()
+        return 0
+    np.seterr(divide="ignore", invalid="ignore")
+    profiling.setup(args.profile, args.output[0])
+
+    # the model is loaded once and shared by all the inputs
+    with profiling.span("load_model"):
+        model, n_features = load_model(args.model, backend=args.backend, threads=args.threads, cache=args.model_cache)
+
+    # deduce the width parameter used during the training
+    width = int((np.sqrt(n_features) - 1) / 2)
 
-        result, R = X.score(thre=args.minimum_prob)
-        X.writeBed(args.output, result, R)
+    for path, output in zip(args.path, args.output):
+        score_genome(path, output, model, width, args)
     return 0
 
 
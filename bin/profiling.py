@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+#########################################
+# File: profiling.py
+# Instrumentation of the bin/ tools: the time and peak RSS of the stages of a
+# tool (load, filter, merge, write, ...), as named spans or as stages following
+# each other, and row counters, saved as a JSON profile next to the outputs.
+# Enabled by the --profile option added by add_argument, or by the
+# HICAR_PROFILE environment variable, set to json (the default), cprofile or
+# pyinstrument to also save a profile of the calls. When disabled, span returns
+# a shared empty context manager, and stage and count return at once, so the
+# hooks can stay in the hot paths.
+# This source code is licensed under the MIT license
+#########################################
+
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+import threading
+
+PROFILE_ENV = "HICAR_PROFILE"
+MODES = ["json", "cprofile", "pyinstrument"]
+# interval of the RSS sampling, in seconds
+SAMPLE_INTERVAL = 0.05
+
+_profiler = None
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def current_rss():
+    # resident memory of the process in Mb
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1048576.0
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Span:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.peak = 0
+
+    def __enter__(self):
+        self.rss = current_rss()
+        self.peak = self.rss
+        self.start = time.time()
+        self.profiler.open_spans.append(self)
+        return self
+
+    def __exit__(self, *args):
+        elapsed = time.time() - self.start
+        self.profiler.open_spans.remove(self)
+        rss = current_rss()
+        stats = self.profiler.spans.setdefault(
+            self.name, {"seconds": 0.0, "calls": 0, "rss_start_mb": self.rss, "peak_rss_mb": 0.0}
+        )
+        stats["seconds"] += elapsed
+        stats["calls"] += 1
+        stats["rss_end_mb"] = rss
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], self.peak, rss)
+        return False
+
+
+class Profiler:
+    def __init__(self, output, mode="json"):
+        self.output = output
+        self.mode = mode
+        self.start = time.time()
+        self.spans = {}
+        self.counters = {}
+        self.open_spans = []
+        self.stage = None
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample)
+        self.sampler.daemon = True
+        self.sampler.start()
+        self.calls = None
+        if mode == "cprofile":
+            import cProfile
+
+            self.calls = cProfile.Profile()
+            self.calls.enable()
+        elif mode == "pyinstrument":
+            try:
+                import pyinstrument
+            except ImportError:
+                sys.stderr.write("pyinstrument is not installed, only the json profile is saved\n")
+            else:
+                self.calls = pyinstrument.Profiler()
+                self.calls.start()
+
+    def sample(self):
+        # the peak RSS of the open spans
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            rss = current_rss()
+            for span in list(self.open_spans):
+                if rss > span.peak:
+                    span.peak = rss
+
+    def close(self):
+        if self.stage is not None:
+            self.stage.__exit__()
+        self.stopped.set()
+        self.sampler.join()
+        if self.mode == "cprofile" and self.calls is not None:
+            self.calls.disable()
+            self.calls.dump_stats(self.output + ".prof")
+        elif self.mode == "pyinstrument" and self.calls is not None:
+            self.calls.stop()
+            with open(self.output + ".profile.html", "w") as f:
+                f.write(self.calls.output_html())
+        profile = {
+            "tool": os.path.basename(sys.argv[0]),
+            "argv": sys.argv[1:],
+            "seconds": time.time() - self.start,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+            "children_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0,
+            "spans": self.spans,
+            "counters": self.counters,
+        }
+        with open(self.output + ".profile.json", "w") as f:
+            json.dump(profile, f, indent=2)
+
+
+def add_argument(parser):
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        nargs="?",
+        const="json",
+        choices=MODES,
+        default=None,
+        help="save the time, rows and peak memory of every stage in <output>.profile.json, "
+        "and the profile of the calls with cprofile or pyinstrument (also set by $%s)" % PROFILE_ENV,
+    )
+
+
+def setup(mode, output):
+    # start profiling to output.profile.json if mode or $HICAR_PROFILE is set, saved at exit
+    global _profiler
+    mode = mode or os.environ.get(PROFILE_ENV)
+    if not mode or mode in ("0", "false"):
+        return None
+    if mode not in MODES:
+        mode = "json"
+    _profiler = Profiler(output, mode)
+    atexit.register(_profiler.close)
+    return _profiler
+
+
+def span(name):
+    if _profiler is None:
+        return NULL_SPAN
+    return Span(_profiler, name)
+
+
+def stage(name):
+    # end the current stage and start the stage name (None to only end it), for the tools
+    # running their stages one after the other
+    if _profiler is None:
+        return
+    if _profiler.stage is not None:
+        _profiler.stage.__exit__()
+    _profiler.stage = Span(_profiler, name).__enter__() if name is not None else None
+
+
+def count(name, n=1):
+    if _profiler is None:
+        return
+    _profiler.counters[name] = _profiler.counters.get(name, 0) + n
@@ -12,91 +12,193 @@
 # modified by Jianhong Ou for multiprocessing.
 #########################################
 
+import os
 import sys
+import mmap
+import shutil
 import argparse
-from Bio import SeqIO
-from Bio.SeqUtils import GC
-import re
+import tempfile
+import numpy as np
 import multiprocessing as mp
+import fragment_table
+import profiling
 
+# G, C and S (G or C) in lower case, as counted by Bio.SeqUtils.GC
+GC_BASES = np.zeros(256, dtype=np.uint8)
+GC_BASES[list(b"gcs")] = 1
 
-def worker(seq_record, mnase, seqs, sizes, poses, binsize, q):
-    outstr = ""
+
+def find_motifs(seq, seqs, sizes, poses):
+    # 1-based start of the non-overlapping hits of every motif in the lower case
+    # sequence, sorted by position
+    site, site_pos, site_size = [], [], []
+    for motif, size, pos in zip(seqs, sizes, poses):
+        motif = motif.lower().encode()
+        hits = []
+        i = seq.find(motif)
+        while i >= 0:
+            hits.append(i + 1)
+            i = seq.find(motif, i + size)
+        site.extend(hits)
+        site_pos.extend([pos] * len(hits))
+        site_size.extend([size] * len(hits))
+    site, site_pos, site_size = np.array(site, dtype=np.int64), np.array(site_pos), np.array(site_size)
+    order = np.lexsort((site_size, site_pos, site))
+
+    return site[order], site_pos[order], site_size[order]
+
+
+def gc_cumsum(seq):
+    # number of GC bases before each position of the lower case sequence
+    cum = np.zeros(len(seq) + 1, dtype=np.uint32)
+    np.cumsum(GC_BASES[np.frombuffer(seq, dtype=np.uint8)], dtype=np.uint32, out=cum[1:])
+
+    return cum
+
+
+def gc_fraction(cum, start, end):
+    # GC fraction of seq[start:end] for arrays of python-style slice bounds
+    length = cum.size - 1
+    start = np.clip(start, 0, length)
+    end = np.maximum(np.clip(end, 0, length), start)
+    width = end - start
+    gc = (cum[end] - cum[start]).astype(np.float64)
+    frac = np.zeros(width.size)
+    valid = width > 0
+    # same arithmetic as GC(seq) / 100
+    frac[valid] = gc[valid] * 100.0 / width[valid] / 100
+
+    return frac
+
+
+def index_fasta(fasta):
+    # (name, first sequence byte, end byte) of each record, from the .fai index if
+    # there is one, otherwise by locating the headers in the memory mapped fasta
+    records = []
+    if os.path.exists(fasta + ".fai"):
+        with open(fasta + ".fai") as f:
+            for line in f:
+                name, length, offset, linebases, linewidth = line.split("\t")[:5]
+                length, offset, linebases, linewidth = int(length), int(offset), int(linebases), int(linewidth)
+                # an empty record has no sequence line
+                end = offset + length // linebases * linewidth + length % linebases if linebases else offset
+                records.append((name, offset, end))
+        return records
+
+    with open(fasta, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        heads = [0] if mm[:1] == b">" else []
+        i = mm.find(b"\n>")
+        while i >= 0:
+            heads.append(i + 1)
+            i = mm.find(b"\n>", i + 1)
+        heads.append(mm.size())
+        for head, end in zip(heads[:-1], heads[1:]):
+            eol = mm.find(b"\n", head, end)
+            eol = end if eol < 0 else eol
+            title = mm[head + 1 : eol].split()
+            records.append((title[0].decode() if title else "", min(eol + 1, end), end))
+        mm.close()
+
+    return records
+
+
+def read_sequence(fasta, start, end):
+    # only the bytes of the requested record are copied out of the mapping
+    with open(fasta, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        seq = mm[start:end].translate(None, b" \r\n")
+        mm.close()
+
+    return seq
+
+
+def digest_chromosome(fasta, name, start, end, mnase, seqs, sizes, poses, binsize):
+    # fragment table of one chromosome, None if there is no site in it
     if not mnase:
-        sys.stderr.write("processing " + seq_record.id + "\n")
-        # print(seq_record.seq[3000181: (3000185 + 30)])
-        site = []
-        site_pos = []
-        site_size = []
-        # so [0-pos] and [len(str(seq_record.seq)) + 1 + pos - size] are added so we can work with them in the for loop, instead of [0-pos] do [0-pos for the first seq found in the seq_record] and instead of pos and size in the second one use pos and size specific to the last re found in the seq_record
-        for i in range(len(seqs)):
-            seq = seqs[i]
-            size = sizes[i]
-            pos = poses[i]
-            # print("searching for:" + seq.lower())
-            ###this is what needs to change:
-            current_site = [m.start() + 1 for m in re.finditer(seq.lower(), str(seq_record.seq).lower())]
-            site = site + current_site
-            site_pos = site_pos + ([pos] * len(current_site))
-            site_size = site_size + ([size] * len(current_site))
-            ##for each site record what is its size and pos and then zip and sort by site, you need the site and pos in the loop below
-        if len(site) == 0:
-            return
-        site, site_pos, site_size = (list(x) for x in zip(*sorted(zip(site, site_pos, site_size))))
-        # print(site[:10])
-        # break
-        first_pos = site_pos[0]
-        first_size = site_size[0]
-        last_pos = site_pos[-1]
-        last_size = site_size[-1]
-        site = [0 - first_pos] + site + [len(str(seq_record.seq)) + 1 + last_pos - last_size]
-        site_pos = [first_pos] + site_pos + [last_pos]
-        site_size = [first_size] + site_size + [last_size]
-
-        for i in range(1, len(site) - 1):
-            count = (i - 1) * 2 + 1
-            frag_start = site[i - 1] + site_pos[i - 1]
-            frag_end = site[i] + site_size[i] - site_pos[i] - 1
-            frag_len = frag_end - frag_start
-            frag_gc = GC(str(seq_record.seq)[max(frag_end - 200, 0) : frag_end]) / 100
-            outstr += "{num}\t{strand}\t{chr}\t{pos}\t{fraglen}\t{GC}\n".format(
-                num=count, strand="-", chr=seq_record.id, pos=frag_end, fraglen=frag_len, GC=frag_gc
-            )
-            frag_start = site[i] + site_pos[i]
-            frag_end = site[i + 1] + site_size[i + 1] - site_pos[i + 1] - 1
-            frag_len = frag_end - frag_start
-            frag_gc = GC(str(seq_record.seq)[frag_start : frag_start + 200]) / 100
-            outstr += "{num}\t{strand}\t{chr}\t{pos}\t{fraglen}\t{GC}\n".format(
-                num=count + 1, strand="+", chr=seq_record.id, pos=frag_start, fraglen=frag_len, GC=frag_gc
-            )
+        sys.stderr.write("processing " + name + "\n")
+        # convert the sequence only once, all the motifs are searched in the same buffer
+        seq = read_sequence(fasta, start, end).lower()
+        site, site_pos, site_size = find_motifs(seq, seqs, sizes, poses)
+        if site.size == 0:
+            return None
+        # so [0-pos] and [len(seq) + 1 + pos - size] are added so the fragments before the first site
+        # and after the last site are computed with the pos and size specific to the first and last re found
+        site = np.r_[0 - site_pos[0], site, len(seq) + 1 + site_pos[-1] - site_size[-1]]
+        site_pos = np.r_[site_pos[0], site_pos, site_pos[-1]]
+        site_size = np.r_[site_size[0], site_size, site_size[-1]]
+
+        cum = gc_cumsum(seq)
+        # fragments upstream (-) and downstream (+) of each site
+        minus_start = site[:-2] + site_pos[:-2]
+        minus_end = site[1:-1] + site_size[1:-1] - site_pos[1:-1] - 1
+        plus_start = site[1:-1] + site_pos[1:-1]
+        plus_end = site[2:] + site_size[2:] - site_pos[2:] - 1
+        minus_gc = gc_fraction(cum, np.maximum(minus_end - 200, 0), minus_end)
+        plus_gc = gc_fraction(cum, plus_start, plus_start + 200)
+
+        # interleave the two fragments of every site
+        count = np.arange(minus_end.size) * 2 + 1
+        fragments = {
+            "num": np.c_[count, count + 1].ravel(),
+            "strand": np.tile(np.array(["-", "+"]), count.size),
+            "pos": np.c_[minus_end, plus_start].ravel(),
+            "fraglen": np.c_[minus_end - minus_start, plus_end - plus_start].ravel(),
+            "gc": np.c_[minus_gc, plus_gc].ravel(),
+        }
     elif mnase:
-        for i, frag_start in enumerate(range(1, len(str(seq_record.seq)) + 1, binsize)):
-            count = i * 2 + 1
-            frag_end = min(frag_start + binsize - 1, len(str(seq_record.seq)))
-            frag_len = binsize - 1
-            frag_gc = GC(str(seq_record.seq)[frag_start:frag_end]) / 100
-            outstr += "{num}\t{strand}\t{chr}\t{pos}\t{fraglen}\t{GC}\n".format(
-                num=count, strand="-", chr=seq_record.id, pos=frag_end, fraglen=frag_len, GC=frag_gc
-            )
-            outstr += "{num}\t{strand}\t{chr}\t{pos}\t{fraglen}\t{GC}\n".format(
-                num=count + 1, strand="+", chr=seq_record.id, pos=frag_start, fraglen=frag_len, GC=frag_gc
-            )
+        # tile the whole chromosome at once, GC of each bin from the cumulative GC counts
+        seq = read_sequence(fasta, start, end).lower()
+        frag_start = np.arange(1, len(seq) + 1, binsize, dtype=np.int64)
+        frag_end = np.minimum(frag_start + binsize - 1, len(seq))
+        frag_gc = gc_fraction(gc_cumsum(seq), frag_start, frag_end)
+        count = np.arange(frag_start.size, dtype=np.int64) * 2 + 1
+        fragments = {
+            "num": np.c_[count, count + 1].ravel(),
+            "strand": np.tile(np.array(["-", "+"]), count.size),
+            "pos": np.c_[frag_end, frag_start].ravel(),
+            "fraglen": np.full(2 * count.size, binsize - 1, dtype=np.int64),
+            "gc": np.repeat(frag_gc, 2),
+        }
+
+    fragments["chroms"] = np.array([name])
+    fragments["chrom"] = np.zeros(fragments["num"].size, dtype=np.int32)
+
+    return fragments
+
 
-    q.put(outstr)
+def worker(fasta, name, start, end, mnase, seqs, sizes, poses, binsize, outfile, table=False):
+    # write the fragments of one chromosome to its own file (and to outfile.npz if table
+    # is set), return None if there is none
+    fragments = digest_chromosome(fasta, name, start, end, mnase, seqs, sizes, poses, binsize)
+    if fragments is None:
+        return None
+    with open(outfile, "w") as out:
+        fragment_table.write_text(out, fragments)
+    if table:
+        np.savez(outfile + ".npz", **fragments)
 
+    return outfile
 
-def listener(outfile, q):
-    with open(outfile, "w") as f:
-        while 1:
-            m = q.get()
-            if m == "kill":
-                f.close()
+
+def run_worker(job):
+    return worker(*job)
+
+
+def append_file(out, part):
+    # copy a chromosome file to the end of the output inside the kernel
+    size = os.path.getsize(part)
+    offset = 0
+    with open(part, "rb") as f:
+        while offset < size:
+            sent = os.sendfile(out.fileno(), f.fileno(), offset, size - offset)
+            if sent == 0:
                 break
-            f.write(str(m))
-            f.flush()
+            offset += sent
 
 
-def find_site(fasta, seq, outfile, pos, cores, binsize):
+def parse_sites(seq, pos):
+    # (mnase, motifs, motif sizes, cut positions) of the -s and -p arguments
     mnase = False
     if len(seq.split(",")) > 1:
         seqs = seq.split(",")
@@ -109,23 +211,101 @@ def find_site(fasta, seq, outfile, pos, cores, binsize):
         sizes = [len(seq)]
         poses = [int(pos)] if not mnase else [0]
 
-    manager = mp.Manager()
-    q = manager.Queue()
+    return mnase, seqs, sizes, poses
+
+
+def cache_path(cache_dir, fasta, mnase, seqs, poses, binsize):
+    # the digest only depends on the bin size for MNase
+    key = fragment_table.cache_key(
+        fragment_table.file_md5(fasta), ",".join(seqs), ",".join(map(str, poses)), binsize if mnase else ""
+    )
+
+    return os.path.join(cache_dir, key + ".npz")
+
+
+def load_cache(cached):
+    # cached fragment table, None if there is no valid one
+    if not os.path.exists(cached):
+        return None
+    try:
+        fragments = fragment_table.load_table(cached)
+    except (OSError, ValueError) as e:
+        sys.stderr.write("ignore the cached digest: {}\n".format(e))
+        return None
+    sys.stderr.write("use the cached digest " + cached + "\n")
+
+    return fragments
+
+
+def save_cache(cached, fragments):
+    try:
+        if not os.path.isdir(os.path.dirname(cached)):
+            os.makedirs(os.path.dirname(cached))
+        fragment_table.save_table(cached, fragments)
+    except OSError as e:
+        sys.stderr.write("can not write the digest cache: {}\n".format(e))
+
+
+def find_site(fasta, seq, outfile, pos, cores, binsize, table=None, cache_dir=None):
+    mnase, seqs, sizes, poses = parse_sites(seq, pos)
+
+    cached = None
+    if cache_dir:
+        cached = cache_path(cache_dir, fasta, mnase, seqs, poses, binsize)
+        with profiling.span("load"):
+            fragments = load_cache(cached)
+        if fragments is not None:
+            profiling.count("fragments", len(fragments["num"]))
+            with profiling.span("write"), open(outfile, "w") as out:
+                fragment_table.write_text(out, fragments)
+            if table:
+                shutil.copyfile(cached, table)
+            return
+
     if cores > mp.cpu_count():
         cores = mp.cpu_count()
-    pool = mp.Pool(cores)
-    watcher = pool.apply_async(listener, (outfile, q))
-    jobs = []
-    for seq_record in SeqIO.parse(fasta, "fasta"):
-        job = pool.apply_async(worker, (seq_record, mnase, seqs, sizes, poses, binsize, q))
-        jobs.append(job)
-
-    for job in jobs:
-        job.get()
+    tmpdir = tempfile.mkdtemp(prefix=os.path.basename(outfile) + ".", dir=os.path.dirname(os.path.abspath(outfile)))
+    try:
+        # the workers read their own chromosome, only its location is sent to them
+        jobs = [
+            (
+                fasta,
+                name,
+                start,
+                end,
+                mnase,
+                seqs,
+                sizes,
+                poses,
+                binsize,
+                os.path.join(tmpdir, "{}.cut".format(i)),
+                bool(table or cached),
+            )
+            for i, (name, start, end) in enumerate(index_fasta(fasta))
+        ]
+        pool = mp.Pool(cores)
+        parts = []
+        # results come back in the fasta order and are appended as soon as they are ready
+        with profiling.span("digest"), open(outfile, "wb") as out:
+            for part in pool.imap(run_worker, jobs):
+                profiling.count("chromosomes")
+                if part is not None:
+                    append_file(out, part)
+                    os.remove(part)
+                    parts.append(part + ".npz")
+        pool.close()
+        pool.join()
 
-    q.put("kill")
-    pool.close()
-    pool.join()
+        if table or cached:
+            with profiling.span("write"):
+                fragments = fragment_table.concatenate(fragment_table.load_table(part) for part in parts)
+                profiling.count("fragments", len(fragments["num"]))
+                if table:
+                    fragment_table.save_table(table, fragments)
+                if cached:
+                    save_cache(cached, fragments)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
 
 
 def main():
@@ -137,20 +317,31 @@ def main():
     parser.add_argument("-s", "--seq", dest="seq", required=True, help="RE cut sequence")
     parser.add_argument("-o", "--out", dest="outfile", required=True, help="Output file")
     parser.add_argument("-p", "--pos", dest="pos", required=True, help="RE cut position")
+    parser.add_argument(
+        "-t", "--table", dest="table", required=False, help="Output the fragments as a binary table (.npz) as well"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        required=False,
+        help="Folder to keep the digests, keyed by the checksum of the fasta file, the sites and the MNase bin size",
+    )
     parser.add_argument(
         "-b", "--binsize", dest="binsize", required=False, help="bin size for MNase-based", default="5Kb"
     )
     parser.add_argument(
         "-c", "--cores", dest="cores", default=1, type=int, required=False, help="number of cores for multiprocessing"
     )
+    profiling.add_argument(parser)
     args = parser.parse_args()
+    profiling.setup(args.profile, args.outfile)
     bin_size = args.binsize.replace("Kb", "000")
     bin_size = bin_size.replace("Mb", "000000")
     try:
         bin_size = int(bin_size)
     except ValueError:
-        sys.exit("Unknown bin size %s, please double check." % args.bin_size)
-    find_site(args.fasta, args.seq, args.outfile, args.pos, args.cores, bin_size)
+        sys.exit("Unknown bin size %s, please double check." % args.binsize)
+    find_site(args.fasta, args.seq, args.outfile, args.pos, args.cores, bin_size, args.table, args.cache_dir)
 
 
 if __name__ == "__main__":
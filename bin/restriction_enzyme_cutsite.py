@@ -5,9 +5,17 @@
 # This source code is licensed under the MIT license
 #########################################
 
-import Bio.Restriction as biorst
-import argparse
+import os
 import sys
+import json
+import argparse
+
+# table of the recognition sites and cut positions of the restriction enzymes,
+# written by --write-table from Bio.Restriction and read by the pipeline when it
+# starts (WorkflowHicar.restrictionEnzyme), so resolving the enzyme needs no task
+TABLE = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, "assets", "restriction_enzymes.tsv")
+COLUMNS = ["enzyme", "site", "cut", "restriction_sites"]
+MNASE = {"enzyme": "MNase", "site": "mnase", "cut": 0, "restriction_sites": ""}
 
 
 def parse_args(args=None):
@@ -16,21 +24,84 @@ def parse_args(args=None):
     argParser = argparse.ArgumentParser(description=Description, epilog=Epilog)
 
     ## REQUIRED PARAMETERS
-    argParser.add_argument("ENZYME", help="enzyme name")
+    argParser.add_argument("ENZYME", nargs="?", help="enzyme name")
+    argParser.add_argument("--table", default=TABLE, help="table of the restriction enzymes")
+    argParser.add_argument("--json", action="store_true", help="print the record of the enzyme as json")
+    argParser.add_argument(
+        "--write-table", dest="write_table", action="store_true", help="write the table from Bio.Restriction"
+    )
     return argParser.parse_args(args)
 
 
+def enzyme_record(en):
+    # the cut position is the offset of the 5' cut in the site, unknown for some enzymes
+    cut = en.fst5
+    record = {"enzyme": str(en), "site": en.site, "cut": cut, "restriction_sites": ""}
+    if cut is not None and 0 <= cut <= len(en.site):
+        # the enzymes cutting after the site, e.g. NlaIII (CATG^), leave the whole site on the fragment
+        record["restriction_sites"] = en.site + "^" if cut == len(en.site) else "^" + en.site[cut:]
+    return record
+
+
+def write_table(path):
+    import Bio
+    import Bio.Restriction as biorst
+
+    records = [MNASE] + sorted((enzyme_record(en) for en in biorst.AllEnzymes), key=lambda x: x["enzyme"])
+    with open(path, "w") as f:
+        f.write(
+            "# restriction enzymes of Biopython {}, written by restriction_enzyme_cutsite.py --write-table\n".format(
+                Bio.__version__
+            )
+        )
+        f.write("\t".join(COLUMNS) + "\n")
+        for record in records:
+            f.write("\t".join("" if record[x] is None else str(record[x]) for x in COLUMNS) + "\n")
+
+
+def read_table(path):
+    records = {}
+    with open(path) as f:
+        for line in f:
+            if line.startswith("#") or line.startswith("enzyme\t"):
+                continue
+            record = dict(zip(COLUMNS, line.rstrip("\n").split("\t")))
+            record["cut"] = int(record["cut"]) if record["cut"] else None
+            records[record["enzyme"].lower()] = record
+    return records
+
+
+def get_enzyme(name, table=TABLE):
+    # from the table, or from Bio.Restriction for the enzymes newer than the table
+    if os.path.exists(table):
+        record = read_table(table).get(name.lower())
+        if record is not None:
+            return record
+    if name.lower() == "mnase":
+        return MNASE
+    import Bio.Restriction as biorst
+
+    try:
+        return enzyme_record(getattr(biorst, name))
+    except AttributeError:
+        raise ValueError("Unknown enzyme name: {}".format(name))
+
+
 def main(args=None):
     args = parse_args(args)
-    if args.ENZYME.lower() == "mnase":
-        sys.stdout.write("mnase 0")
-    else:
-        try:
-            en = getattr(biorst, args.ENZYME)
-        except AttributeError:
-            raise ValueError("Unknown enzyme name: {}".format(args.ENZYME))
+    if args.write_table:
+        write_table(args.table)
+        return 0
+    if not args.ENZYME:
+        raise ValueError("The enzyme name is required")
 
-        sys.stdout.write(en.site + " " + str(en.fst5))
+    record = get_enzyme(args.ENZYME, args.table)
+    if args.json:
+        sys.stdout.write(json.dumps(record) + "\n")
+    else:
+        if record["cut"] is None:
+            raise ValueError("Unknown cut position of the enzyme: {}".format(args.ENZYME))
+        sys.stdout.write(record["site"] + " " + str(record["cut"]))
 
     sys.stdout.flush()
     return 0
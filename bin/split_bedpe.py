@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+#########################################
+# File: split_bedpe.py
+# Split the pixels dumped by cooler (cooler dump -t pixels -H --join) into one
+# file per chromosome pair, and write the juicer short format (ginteractions)
+# in the same pass. Same output as
+#   awk -F "\t" '! /^chrom1/ {print > prefix"."$1"_"$4"."suffix}'
+#   awk -F "\t" '{print 0, $1, $2, 0, 0, $4, $5, 1, $7}' > ginteractions
+# The lines of every pair are buffered, and only a limited number of files are
+# kept open at a time. The pair files are written as text, BGZF (suffix ending
+# in .gz) or numpy structured arrays (suffix ending in .npy). The chromosome
+# pairs written are listed in prefix.suffix.index with the number of pixels.
+# This source code is licensed under the MIT license
+#########################################
+
+import os
+import sys
+import shutil
+import argparse
+import numpy as np
+from collections import OrderedDict
+import bgzf
+
+# columns of the pair files written as numpy arrays
+NPY_DTYPE = np.dtype([("start1", "<i8"), ("end1", "<i8"), ("start2", "<i8"), ("end2", "<i8"), ("count", "<f8")])
+
+
+class PairWriter:
+    # buffered writers of the pair files, with at most max_open files opened at once
+    def __init__(self, prefix, suffix, max_open=128, buffer_size=1 << 20, max_buffered=256 << 20):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.mode = "gz" if suffix.endswith(".gz") else "npy" if suffix.endswith(".npy") else "text"
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.max_buffered = max_buffered
+        self.buffered = 0
+        self.opened = set()
+        self.sizes = {}
+        self.buffers = OrderedDict()
+        self.counts = OrderedDict()
+        self.handles = OrderedDict()
+
+    def filename(self, key):
+        name = self.prefix + "." + key[0] + "_" + key[1] + "." + self.suffix
+        # the npy header needs the number of records, the records are written to name.tmp first
+        return name + ".tmp" if self.mode == "npy" else name
+
+    def add(self, key, line):
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            buffer = self.buffers[key] = []
+            self.counts.setdefault(key, 0)
+            self.sizes[key] = 0
+        buffer.append(line)
+        self.counts[key] += 1
+        self.sizes[key] += len(line)
+        self.buffered += len(line)
+        if self.sizes[key] > self.buffer_size:
+            self.flush(key)
+        elif self.buffered > self.max_buffered:
+            for k in list(self.buffers):
+                self.flush(k)
+
+    def handle(self, key):
+        f = self.handles.pop(key, None)
+        if f is None:
+            if len(self.handles) >= self.max_open:
+                self.handles.popitem(last=False)[1].close()
+            # truncate the file the first time it is opened
+            f = open(self.filename(key), "ab" if key in self.opened else "wb")
+            self.opened.add(key)
+        self.handles[key] = f
+
+        return f
+
+    def flush(self, key):
+        lines = self.buffers[key]
+        if not lines:
+            return
+        self.buffered -= self.sizes[key]
+        self.sizes[key] = 0
+        self.buffers[key] = []
+        f = self.handle(key)
+        if self.mode == "npy":
+            fields = [line.split("\t") for line in lines]
+            records = np.empty(len(fields), dtype=NPY_DTYPE)
+            for i, name in zip((1, 2, 4, 5, 6), NPY_DTYPE.names):
+                records[name] = [x[i] for x in fields]
+            records.tofile(f)
+        elif self.mode == "gz":
+            f.write(bgzf.compress("".join(lines).encode()))
+        else:
+            f.write("".join(lines).encode())
+
+    def close(self):
+        for key in list(self.buffers):
+            self.flush(key)
+        for f in self.handles.values():
+            f.close()
+        self.handles.clear()
+        for key in self.counts:
+            name = self.filename(key)
+            if self.mode == "gz":
+                with open(name, "ab") as f:
+                    f.write(bgzf.EOF)
+            elif self.mode == "npy":
+                with open(name[: -len(".tmp")], "wb") as out:
+                    np.lib.format.write_array_header_1_0(
+                        out,
+                        {
+                            "descr": np.lib.format.dtype_to_descr(NPY_DTYPE),
+                            "fortran_order": False,
+                            "shape": (self.counts[key],),
+                        },
+                    )
+                    with open(name, "rb") as f:
+                        shutil.copyfileobj(f, out)
+                os.remove(name)
+
+    def write_index(self, path):
+        with open(path, "w") as f:
+            for key, count in sorted(self.counts.items()):
+                name = self.prefix + "." + key[0] + "_" + key[1] + "." + self.suffix
+                f.write("%s\t%s\t%s\t%d\n" % (key[0], key[1], os.path.basename(name), count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split the pixels of cooler dump by chromosome pairs")
+    parser.add_argument("-i", "--input", dest="bedpe", required=True, help="pixels dumped by cooler dump --join")
+    parser.add_argument("-p", "--prefix", dest="prefix", required=True, help="prefix of the output files")
+    parser.add_argument(
+        "-s", "--suffix", dest="suffix", required=True, help="suffix of the chromosome pair files, e.g. long.bedpe"
+    )
+    parser.add_argument("-g", "--ginteractions", dest="ginteractions", required=False, help="ginteractions output")
+    parser.add_argument(
+        "--max-open", dest="max_open", default=128, type=int, help="maximal number of files opened at a time"
+    )
+    args = parser.parse_args()
+
+    writer = PairWriter(args.prefix, args.suffix, max_open=args.max_open)
+    gi = open(args.ginteractions, "w") if args.ginteractions else None
+    with open(args.bedpe, "r") as f:
+        while True:
+            lines = f.readlines(1 << 22)
+            if not lines:
+                break
+            gi_lines = []
+            for line in lines:
+                if not line.endswith("\n"):
+                    line += "\n"
+                fields = line[:-1].split("\t")
+                fields.extend([""] * (7 - len(fields)))
+                if gi is not None:
+                    gi_lines.append(
+                        "0 %s %s 0 0 %s %s 1 %s\n" % (fields[0], fields[1], fields[3], fields[4], fields[6])
+                    )
+                if not line.startswith("chrom1"):
+                    writer.add((fields[0], fields[3]), line)
+            if gi is not None:
+                gi.write("".join(gi_lines))
+    if gi is not None:
+        gi.close()
+    writer.close()
+    writer.write_index(args.prefix + "." + args.suffix + ".index")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -105,6 +105,26 @@ class WorkflowHicar {
         return description_html
     }
 
+    //
+    // Get the recognition site and cut position of a restriction enzyme from the table
+    // written by bin/restriction_enzyme_cutsite.py --write-table
+    //
+    public static Map restrictionEnzyme(enzyme, table) {
+        def columns = ['enzyme', 'site', 'cut', 'restriction_sites']
+        def record = new File(table.toString()).readLines()
+            .findAll { line -> !line.startsWith('#') }
+            .drop(1)
+            .collect { line -> [columns, line.split('\t', -1).toList()].transpose().collectEntries() }
+            .find { it.enzyme.toLowerCase() == enzyme.toString().toLowerCase() }
+        if (!record) {
+            Nextflow.error("Unknown restriction enzyme '${enzyme}', the supported enzymes are listed in ${table}")
+        }
+        if (!record.cut) {
+            Nextflow.error("The cut position of the restriction enzyme '${enzyme}' is unknown")
+        }
+        return record
+    }
+
     //
     // Exit pipeline if incorrect --genome key provided
     //
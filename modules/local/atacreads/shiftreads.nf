@@ -1,12 +1,12 @@
 process SHIFT_READS {
     tag "$meta.id"
-    label 'process_low'
+    label 'process_medium'
 
-    conda "anaconda::gawk=5.1.0"
+    conda "pandas=1.1.5"
     container "${ workflow.containerEngine == 'singularity' &&
                     !task.ext.singularity_pull_docker_container ?
-        'https://depot.galaxyproject.org/singularity/gawk:5.1.0' :
-        'biocontainers/gawk:5.1.0' }"
+        'https://depot.galaxyproject.org/singularity/pandas:1.1.5' :
+        'biocontainers/pandas:1.1.5' }"
 
     input:
     tuple val(meta), path(pair)
@@ -19,20 +19,20 @@ process SHIFT_READS {
 
     script:
     def prefix   = task.ext.prefix ? "${meta.id}${task.ext.prefix}" : "${meta.id}"
-    def command  = do_shift ?
-        'BEGIN {OFS="\t"};  /^[^#]/ { if (\$7 == "+") {\$5 = \$5 + 4} else if (\$7 == "-") {\$5 = \$5 - 5};  print \$4, \$5, \$5+1, "*", "0", \$7}' :
-        'BEGIN {OFS="\t"};  /^[^#]/ { print \$4, \$5, \$5+1, "*", "0", \$7 }'
+    def shift    = do_shift ? '--shift' : ''
+    def memory   = task.memory ? "--memory ${(task.memory.toMega() * 0.6).intValue()}" : ''
     """
-    gunzip -c $pair | \\
-        awk '$command' | \\
-        sort -k1,1 -k2,2n | \\
-        uniq | \\
-        gzip -nc > ${prefix}.R2.ATAC.bed.gz
-    echo \$(cat $pair | wc -l)
+    pairs2bed.py \\
+        -i $pair \\
+        -o ${prefix}.R2.ATAC.bed.gz \\
+        -t $task.cpus \\
+        $memory \\
+        $shift
 
     cat <<-END_VERSIONS > versions.yml
     "${task.process}":
-        awk: \$(echo \$(awk --version 2>&1 || awk -W version 2>&1) | sed 's/[[:alpha:]|(|)|[:space:]]//g; s/,.*\$//')
+        python: \$(echo \$(python --version) | sed 's/Python //')
+        pandas: \$(python -c "import pandas; print(pandas.__version__)")
     END_VERSIONS
     """
 }
@@ -1,5 +1,5 @@
 process BIOC_ENZYMECUT {
-    tag "$bin_size"
+    tag "$enzyme"
     label 'process_medium'
     label 'error_ignore'
 
@@ -10,11 +10,11 @@ process BIOC_ENZYMECUT {
         'biocontainers/bioconductor-trackviewer:1.28.0--r41h399db7b_0' }"
 
     input:
-    tuple val(bin_size), val(site), path(fasta)
+    tuple val(id), val(site), path(fasta)
     val enzyme
 
     output:
-    tuple val(bin_size), path('*.cut')        , emit: cut
+    tuple val(id), path('*.cut')              , emit: cut
     path "versions.yml"                       , emit: versions
 
     script:
@@ -2,11 +2,11 @@ process DUMPREADS {
     tag "${meta.id}"
     label 'process_medium'
 
-    conda "anaconda::gawk=5.1.0"
+    conda "pandas=1.1.5"
     container "${ workflow.containerEngine == 'singularity' &&
                     !task.ext.singularity_pull_docker_container ?
-        'https://depot.galaxyproject.org/singularity/gawk:5.1.0' :
-        'biocontainers/gawk:5.1.0' }"
+        'https://depot.galaxyproject.org/singularity/pandas:1.1.5' :
+        'biocontainers/pandas:1.1.5' }"
 
     input:
     tuple val(meta), path(bedpe)
@@ -15,21 +15,23 @@ process DUMPREADS {
     output:
     tuple val(meta), path("*.${long_bedpe_postfix}")       , emit: bedpe
     tuple val(meta), path("*.ginteractions")               , emit: gi
+    tuple val(meta), path("*.${long_bedpe_postfix}.index") , emit: index
     path  "versions.yml"                                   , emit: versions
 
     script:
     def prefix   = task.ext.prefix ?: "${meta.id}"
+    def args     = task.ext.args ?: ''
     """
-    awk -F "\\t" \\
-        '! /^chrom1/ {print > "${prefix}."\$1"_"\$4".${long_bedpe_postfix}"}' \\
-        $bedpe
-
-    awk -F "\\t" '{print 0, \$1, \$2, 0, 0, \$4, \$5, 1, \$7}' $bedpe > \\
-        ${prefix}.${meta.bin}.ginteractions
+    split_bedpe.py \\
+        -i $bedpe \\
+        -p ${prefix} \\
+        -s ${long_bedpe_postfix} \\
+        -g ${prefix}.${meta.bin}.ginteractions \\
+        $args
 
     cat <<-END_VERSIONS > versions.yml
     "${task.process}":
-        awk: \$(echo \$(awk --version 2>&1) | sed -e "s/GNU Awk //g; s/, API.*\$//")
+        python: \$(echo \$(python --version) | sed 's/Python //')
     END_VERSIONS
     """
 }
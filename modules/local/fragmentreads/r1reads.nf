@@ -1,12 +1,12 @@
 process R1READS {
     tag "$meta.id"
-    label 'process_low'
+    label 'process_medium'
 
-    conda "anaconda::gawk=5.1.0"
+    conda "pandas=1.1.5"
     container "${ workflow.containerEngine == 'singularity' &&
                     !task.ext.singularity_pull_docker_container ?
-        'https://depot.galaxyproject.org/singularity/gawk:5.1.0' :
-        'biocontainers/gawk:5.1.0' }"
+        'https://depot.galaxyproject.org/singularity/pandas:1.1.5' :
+        'biocontainers/pandas:1.1.5' }"
 
     input:
     tuple val(meta), path(pair)
@@ -17,15 +17,21 @@ process R1READS {
 
     script:
     def prefix   = task.ext.prefix ? "${meta.id}${task.ext.prefix}" : "${meta.id}"
+    def memory   = task.memory ? "--memory ${(task.memory.toMega() * 0.6).intValue()}" : ''
     """
-    gunzip -c $pair | \\
-        awk 'BEGIN {OFS="\t"};  /^[^#]/ { print \$2, \$3, \$3+1, "*", "*", \$6}' | \\
-        sort -k1,1 -k2,2n | \\
-        gzip -nc > ${prefix}.R1.distal.bed.gz
+    pairs2bed.py \\
+        -i $pair \\
+        -o ${prefix}.R1.distal.bed.gz \\
+        --read 1 \\
+        --score '*' \\
+        --keep-duplicates \\
+        -t $task.cpus \\
+        $memory > /dev/null
 
     cat <<-END_VERSIONS > versions.yml
     "${task.process}":
-        awk: \$(echo \$(awk --version 2>&1 || awk -W version 2>&1) | sed 's/[[:alpha:]|(|)|[:space:]]//g; s/,.*\$//')
+        python: \$(echo \$(python --version) | sed 's/Python //')
+        pandas: \$(python -c "import pandas; print(pandas.__version__)")
     END_VERSIONS
     """
 }
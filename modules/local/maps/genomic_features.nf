@@ -0,0 +1,46 @@
+process MAPS_GENOMIC_FEATURES {
+    tag "$bin_size"
+    label 'process_medium'
+    label 'process_high_cpus'
+    label 'error_retry'
+
+    conda "bioconda::hicexplorer=3.7.2"
+    container "${ workflow.containerEngine == 'singularity' &&
+                    !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/hicexplorer:3.7.2--pyhdfd78af_1' :
+        'biocontainers/hicexplorer:3.7.2--pyhdfd78af_1' }"
+
+    input:
+    tuple val(bin_size), val(site), path(digest) // digest: the restriction fragments, or the fasta for MNase
+    path chrom_sizes
+    path mappability
+    val enzyme
+
+    output:
+    tuple val(bin_size), path("*_el.txt")  , emit: bin_feature
+    path "versions.yml"                    , emit: versions
+
+    script:
+    def args = task.ext.args ?: ''
+    def mnase = enzyme.toLowerCase() == "mnase"
+    def input = mnase ? "-f ${digest} -s \${cut[0]} -p \${cut[1]}" : "--cut ${digest}"
+    def prefix = mnase ? "${bin_size}_${enzyme}" : "${digest.getSimpleName()}"
+    """
+    cut=($site)
+    maps_genomic_features.py \\
+        $input \\
+        -m $mappability \\
+        -g $chrom_sizes \\
+        -b $bin_size \\
+        -o F_GC_M_${prefix}_${bin_size}_el.txt \\
+        -c $task.cpus \\
+        ${task.memory ? "--max-memory ${task.memory.toBytes()}" : ''} \\
+        $args
+
+    cat <<-END_VERSIONS > versions.yml
+    "${task.process}":
+        python: \$(python --version | sed 's/Python //g')
+        MAPS: 1.1.0
+    END_VERSIONS
+    """
+}
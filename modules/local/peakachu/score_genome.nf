@@ -26,6 +26,7 @@ process PEAKACHU_SCORE {
         --path ${cool} \\
         --model ${model} \\
         --output ${prefix}.bedpe \\
+        --threads $task.cpus \\
         $args
 
     cat <<-END_VERSIONS > versions.yml
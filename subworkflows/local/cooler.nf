@@ -61,6 +61,7 @@ workflow COOLER {
     hic         = ch_hic                                    // channel: [ val(meta), [hic] ]
     groupbedpe  = COOLER_DUMP_PER_GROUP.out.bedpe           // channel: [ val(meta), [bedpe] ]
     bedpe       = DUMPREADS_PER_GROUP.out.bedpe             // channel: [ val(meta), [bedpe] ]
+    bedpe_index = DUMPREADS_PER_GROUP.out.index             // channel: [ val(meta), index ]
     samplebedpe = DUMPREADS_PER_SAMPLE.out.bedpe            // channel: [ val(meta), [bedpe] ]
     versions    = ch_version                                // channel: [ path(version) ]
 }
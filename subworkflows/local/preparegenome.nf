@@ -12,7 +12,6 @@ include { GTF2BED                     } from '../../modules/local/gtf2bed'
 include { CHROMSIZES                  } from '../../modules/local/genome/chromsizes'
 include { GENOME_FILTER               } from '../../modules/local/genome/filter'
 include { COOLER_DIGEST               } from '../../modules/nf-core/cooler/digest/main'
-include { RE_CUTSITE                  } from '../../modules/local/re_cut'
 include { GFFREAD                     } from '../../modules/nf-core/gffread/main'
 include { GENMAP_INDEX                } from '../../modules/nf-core/genmap/index/main'
 include { GENMAP_MAPPABILITY          } from '../../modules/nf-core/genmap/mappability/main'
@@ -137,10 +136,11 @@ workflow PREPARE_GENOME {
     ch_version = ch_version.mix(COOLER_DIGEST.out.versions)
 
     /*
-     * get enzyme cut site and position for function maps:cut or enzyme_cut
+     * get enzyme cut site and position for function maps:cut or enzyme_cut,
+     * from the table of the restriction enzymes instead of a task
      */
-    RE_CUTSITE ( params.enzyme )
-    ch_version = ch_version.mix(RE_CUTSITE.out.versions)
+    def enzyme = WorkflowHicar.restrictionEnzyme(params.enzyme, "${projectDir}/assets/restriction_enzymes.tsv")
+    ch_site = Channel.value("${enzyme.site} ${enzyme.cut}")
 
     /*
      * mappability
@@ -169,7 +169,7 @@ workflow PREPARE_GENOME {
     blacklist         = ch_blacklist                   // path: blacklist.bed,
     bed               = filtered_bed                   // path: *.bed,
     digest_genome     = digest_genome_bed              // path: bed
-    site              = RE_CUTSITE.out.site            // value: site 5position
+    site              = ch_site                        // value: site 5position
     mappability       = ch_mappability                 // path: bw
     bwa_index         = ch_bwa_index                   // path: bwt,amb,sa,ann,pac
     gsize             = genome_size                    // value: macs2 genome size
@@ -6,6 +6,7 @@ import requests
 import shutil
 from pathlib import Path
 import typing
+from datetime import datetime
 import typing_extensions
 
 from latch.resources.workflow import workflow
@@ -25,20 +26,31 @@ meta = Path("latch_metadata") / "__init__.py"
 import_module_by_path(meta)
 import latch_metadata
 
+from wf.resources import container_cpus, container_memory, count_samples, estimate_storage, executor_config, jvm_options
+from wf.logs import LogUploader
+from wf.staging import stage_workflow
+from wf.trace_report import read_trace, summarize, write_report
+
 @custom_task(cpu=0.25, memory=0.5, storage_gib=1)
-def initialize() -> str:
+def initialize(input: LatchFile, interactions_tool: typing.Optional[str]) -> str:
     token = os.environ.get("FLYTE_INTERNAL_EXECUTION_ID")
     if token is None:
         raise RuntimeError("failed to get execution token")
 
     headers = {"Authorization": f"Latch-Execution-Token {token}"}
 
-    print("Provisioning shared storage volume... ", end="")
+    try:
+        storage_gib = estimate_storage(Path(input), interactions_tool)
+    except Exception as e:
+        print(f"Failed to estimate the storage from the samplesheet, using 100 GiB: {e}")
+        storage_gib = 100
+
+    print(f"Provisioning shared storage volume of {storage_gib} GiB... ", end="")
     resp = requests.post(
         "http://nf-dispatcher-service.flyte.svc.cluster.local/provision-storage",
         headers=headers,
         json={
-            "storage_gib": 100,
+            "storage_gib": storage_gib,
         }
     )
     resp.raise_for_status()
@@ -53,30 +65,48 @@ def initialize() -> str:
 
 @nextflow_runtime_task(cpu=4, memory=8, storage_gib=100)
 def nextflow_runtime(pvc_name: str, input: LatchFile, anchor_peaks: typing.Optional[LatchFile], outdir: typing_extensions.Annotated[LatchDir, FlyteAnnotation({'output': True})], email: typing.Optional[str], multiqc_title: typing.Optional[str], genome: typing.Optional[str], fasta: typing.Optional[LatchFile], bwa_index: typing.Optional[str], gtf: typing.Optional[LatchFile], gff: typing.Optional[LatchFile], gene_bed: typing.Optional[LatchFile], mappability: typing.Optional[LatchFile], macs_gsize: typing.Optional[str], ucscname: typing.Optional[str], blacklist: typing.Optional[LatchFile], publish_mappability: typing.Optional[bool], publish_genome: typing.Optional[bool], call_high_peak: typing.Optional[bool], multiqc_methods_description: typing.Optional[str], skip_cutadapt: typing.Optional[bool], resample_pairs: typing.Optional[bool], skip_fastqc: typing.Optional[bool], skip_peak_annotation: typing.Optional[bool], skip_diff_analysis: typing.Optional[bool], skip_multiqc: typing.Optional[bool], do_apa: typing.Optional[bool], skip_compartments: typing.Optional[bool], skip_tads: typing.Optional[bool], skip_interactions: typing.Optional[bool], do_tfea: typing.Optional[bool], create_virtual_4c: typing.Optional[bool], skip_circos: typing.Optional[bool], method: typing.Optional[str], enzyme: typing.Optional[str], restriction_sites_cut_off: typing.Optional[float], cutadapt_5end: typing.Optional[str], shiftsize: typing.Optional[int], smooth_window: typing.Optional[int], qval_thresh: typing.Optional[float], cool_bin: typing.Optional[str], maps_digest_file: typing.Optional[str], maps_cutoff_counts: typing.Optional[int], maps_cutoff_fold_change: typing.Optional[float], maps_cutoff_fdr: typing.Optional[float], maps_filter: typing.Optional[str], maps_model: typing.Optional[str], snow_type: typing.Optional[str], hicdcplus_cutoff_fdr: typing.Optional[float], peakachu_pretrained_url: typing.Optional[str], r1_pval_thresh: typing.Optional[float], res_compartments: typing.Optional[int], res_tads: typing.Optional[int], tad_tool: typing.Optional[str], apa_peak: typing.Optional[str], apa_tool: typing.Optional[str], apa_format: typing.Optional[str], compartments_tool: typing.Optional[str], interactions_tool: typing.Optional[str], da_tool: typing.Optional[str], v4c_tool: typing.Optional[str], tfea_tool: typing.Optional[str], juicer_tools_jar: typing.Optional[str], juicer_norm_method: typing.Optional[str], peak_interactions_threshold: typing.Optional[int], v4c_max_events: typing.Optional[int], hic_tools_jar: typing.Optional[str]) -> None:
+    uploader = None
+    trace_file = None
+    timeline_file = None
+    trace_timestamp = None
     try:
         shared_dir = Path("/nf-workdir")
 
 
 
-        ignore_list = [
-            "latch",
-            ".latch",
-            "nextflow",
-            ".nextflow",
-            "work",
-            "results",
-            "miniconda",
-            "anaconda3",
-            "mambaforge",
-        ]
-
-        shutil.copytree(
-            Path("/root"),
-            shared_dir,
-            ignore=lambda src, names: ignore_list,
-            ignore_dangling_symlinks=True,
-            dirs_exist_ok=True,
-        )
+        stage_workflow(Path("/root"), shared_dir)
+
+        try:
+            samples = count_samples(Path(input))
+        except Exception as e:
+            print(f"Failed to count the samples of the samplesheet, sizing the executor for one: {e}")
+            samples = 1
+        executor_file = shared_dir / "latch.executor.config"
+        executor_file.write_text(executor_config(samples))
+        print(f"Executor settings for {samples} samples:")
+        print(executor_file.read_text())
+
+        nxf_opts = jvm_options(container_cpus(), container_memory())
+        print(f"NXF_OPTS: {nxf_opts}")
+
+        trace_file = shared_dir / "trace.txt"
+        timeline_file = shared_dir / "timeline.html"
+        trace_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        name = _get_execution_name()
+        if name is None:
+            print("Skipping logs upload, failed to get execution name")
+        else:
+            remote = urljoins("latch:///your_log_dir/nf_nf_core_hicar", name)
+            print(f"Uploading .nextflow.log and the trace to {remote} while running")
+            uploader = LogUploader(
+                {
+                    shared_dir / ".nextflow.log": "nextflow.log",
+                    trace_file: "trace.txt",
+                    timeline_file: "timeline.html",
+                },
+                remote,
+            )
+            uploader.start()
 
         cmd = [
             "/root/nextflow",
@@ -88,6 +118,12 @@ def nextflow_runtime(pvc_name: str, input: LatchFile, anchor_peaks: typing.Optio
             "docker",
             "-c",
             "latch.config",
+            "-c",
+            str(executor_file),
+            "-with-trace",
+            str(trace_file),
+            "-with-timeline",
+            str(timeline_file),
                 *get_flag('input', input),
                 *get_flag('method', method),
                 *get_flag('anchor_peaks', anchor_peaks),
@@ -163,7 +199,7 @@ def nextflow_runtime(pvc_name: str, input: LatchFile, anchor_peaks: typing.Optio
         env = {
             **os.environ,
             "NXF_HOME": "/root/.nextflow",
-            "NXF_OPTS": "-Xms2048M -Xmx8G -XX:ActiveProcessorCount=4",
+            "NXF_OPTS": nxf_opts,
             "K8S_STORAGE_CLAIM_NAME": pvc_name,
             "NXF_DISABLE_CHECK_LATEST": "true",
         }
@@ -176,15 +212,27 @@ def nextflow_runtime(pvc_name: str, input: LatchFile, anchor_peaks: typing.Optio
     finally:
         print()
 
-        nextflow_log = shared_dir / ".nextflow.log"
-        if nextflow_log.exists():
-            name = _get_execution_name()
-            if name is None:
-                print("Skipping logs upload, failed to get execution name")
-            else:
-                remote = LPath(urljoins("latch:///your_log_dir/nf_nf_core_hicar", name, "nextflow.log"))
-                print(f"Uploading .nextflow.log to {remote.path}")
-                remote.upload_from(nextflow_log)
+        if trace_file is not None and trace_file.exists():
+            try:
+                report_file = write_report(summarize(read_trace(trace_file)), str(shared_dir / "process_resources"))
+                print(f"Process resource report written to {report_file}")
+                if uploader is not None:
+                    uploader.add({report_file: report_file.name})
+            except Exception as e:
+                print(f"Failed to summarize the trace: {e}")
+
+        # -with-trace and -with-timeline replace the pipeline_info files of nextflow.config, publish the copies
+        for local, name in [(trace_file, "execution_trace"), (timeline_file, "execution_timeline")]:
+            if local is None or not local.exists():
+                continue
+            remote = urljoins(outdir.remote_path, "pipeline_info", f"{name}_{trace_timestamp}{local.suffix}")
+            try:
+                LPath(remote).upload_from(local)
+            except Exception as e:
+                print(f"Failed to publish {local} to {remote}: {e}")
+
+        if uploader is not None:
+            uploader.stop()
 
 
 
@@ -196,6 +244,6 @@ def nf_nf_core_hicar(input: LatchFile, anchor_peaks: typing.Optional[LatchFile],
     Sample Description
     """
 
-    pvc_name: str = initialize()
+    pvc_name: str = initialize(input=input, interactions_tool=interactions_tool)
     nextflow_runtime(pvc_name=pvc_name, input=input, method=method, anchor_peaks=anchor_peaks, outdir=outdir, email=email, multiqc_title=multiqc_title, genome=genome, fasta=fasta, bwa_index=bwa_index, gtf=gtf, gff=gff, gene_bed=gene_bed, mappability=mappability, macs_gsize=macs_gsize, ucscname=ucscname, blacklist=blacklist, publish_mappability=publish_mappability, publish_genome=publish_genome, enzyme=enzyme, restriction_sites_cut_off=restriction_sites_cut_off, cutadapt_5end=cutadapt_5end, shiftsize=shiftsize, smooth_window=smooth_window, qval_thresh=qval_thresh, cool_bin=cool_bin, maps_digest_file=maps_digest_file, maps_cutoff_counts=maps_cutoff_counts, maps_cutoff_fold_change=maps_cutoff_fold_change, maps_cutoff_fdr=maps_cutoff_fdr, maps_filter=maps_filter, maps_model=maps_model, snow_type=snow_type, hicdcplus_cutoff_fdr=hicdcplus_cutoff_fdr, peakachu_pretrained_url=peakachu_pretrained_url, call_high_peak=call_high_peak, r1_pval_thresh=r1_pval_thresh, res_compartments=res_compartments, res_tads=res_tads, tad_tool=tad_tool, apa_peak=apa_peak, apa_tool=apa_tool, apa_format=apa_format, compartments_tool=compartments_tool, interactions_tool=interactions_tool, da_tool=da_tool, v4c_tool=v4c_tool, tfea_tool=tfea_tool, juicer_tools_jar=juicer_tools_jar, juicer_norm_method=juicer_norm_method, peak_interactions_threshold=peak_interactions_threshold, v4c_max_events=v4c_max_events, hic_tools_jar=hic_tools_jar, multiqc_methods_description=multiqc_methods_description, skip_cutadapt=skip_cutadapt, resample_pairs=resample_pairs, skip_fastqc=skip_fastqc, skip_peak_annotation=skip_peak_annotation, skip_diff_analysis=skip_diff_analysis, skip_multiqc=skip_multiqc, do_apa=do_apa, skip_compartments=skip_compartments, skip_tads=skip_tads, skip_interactions=skip_interactions, do_tfea=do_tfea, create_virtual_4c=create_virtual_4c, skip_circos=skip_circos)
 
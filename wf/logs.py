@@ -0,0 +1,49 @@
+import threading
+import typing
+from pathlib import Path
+
+from latch.ldata.path import LPath
+from latch_cli.utils import urljoins
+
+
+class LogUploader(threading.Thread):
+    # upload the log files to the remote log directory every interval seconds while nextflow runs,
+    # a file is uploaded again only once it has changed
+    def __init__(self, files: typing.Dict[Path, str], remote_dir: str, interval: int = 60):
+        super().__init__(daemon=True)
+        self.files = files
+        self.remote_dir = remote_dir
+        self.interval = interval
+        self.synced: typing.Dict[Path, typing.Tuple[int, int]] = {}
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def add(self, files: typing.Dict[Path, str]) -> None:
+        with self.lock:
+            self.files.update(files)
+
+    def sync(self) -> None:
+        with self.lock:
+            for local, name in self.files.items():
+                try:
+                    stat = local.stat()
+                except FileNotFoundError:
+                    continue
+                state = (stat.st_size, stat.st_mtime_ns)
+                if self.synced.get(local) == state:
+                    continue
+                try:
+                    LPath(urljoins(self.remote_dir, name)).upload_from(local)
+                    self.synced[local] = state
+                except Exception as e:
+                    print(f"Failed to upload {local}: {e}", flush=True)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.sync()
+
+    def stop(self) -> None:
+        # last upload once nextflow has exited
+        self.stopped.set()
+        self.join(timeout=self.interval)
+        self.sync()
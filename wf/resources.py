@@ -0,0 +1,149 @@
+import csv
+import os
+import typing
+from pathlib import Path
+
+import requests
+from latch.ldata.path import LPath
+
+# size assumed for a fastq file whose size cannot be read, in GiB
+default_fastq_gib = 5
+# size of the intermediate files of each stage relative to the size of the fastq files (gzipped)
+expansion_factors = {
+    "trimmed fastq": 1.0,
+    "bam": 1.5,
+    "pairs": 1.0,
+    "reads bed": 0.3,
+    "coolers": 0.3,
+}
+# extra intermediate files of MAPS, the bedpe dumped per chromosome pair
+maps_expansion_factor = 0.6
+# genome, index, digest and mappability files, in GiB
+reference_gib = 30
+
+
+def read_first(*paths: str) -> typing.Optional[str]:
+    for path in paths:
+        try:
+            return Path(path).read_text().strip()
+        except OSError:
+            continue
+
+    return None
+
+
+def container_cpus() -> int:
+    # cpu limit of the container from cgroup v2 or v1, the cpus of the node otherwise
+    cpus = len(os.sched_getaffinity(0))
+    quota = read_first("/sys/fs/cgroup/cpu.max")
+    if quota is not None:
+        limit, _, period = quota.partition(" ")
+        if limit != "max":
+            return max(1, min(cpus, int(int(limit) / int(period or 100000))))
+    limit = read_first("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = read_first("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if limit is not None and period is not None and int(limit) > 0:
+        return max(1, min(cpus, int(int(limit) / int(period))))
+
+    return cpus
+
+
+def container_memory() -> int:
+    # memory limit of the container in bytes from cgroup v2 or v1, the memory of the node otherwise
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    limit = read_first("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if limit is not None and limit != "max":
+        # cgroup v1 reports a huge number when there is no limit
+        return min(total, int(limit))
+
+    return total
+
+
+def jvm_options(cpus: int, memory: int) -> str:
+    # leave a quarter of the container (at least 1G) to the JVM metaspace, threads and the other processes
+    memory_mb = memory >> 20
+    heap = max(512, min(memory_mb * 3 // 4, memory_mb - 1024))
+    initial = min(2048, heap // 4)
+
+    return f"-Xms{initial}M -Xmx{heap}M -XX:ActiveProcessorCount={cpus} -XX:+UseG1GC"
+
+
+def count_samples(samplesheet: Path) -> int:
+    # number of rows of the samplesheet, every row is a pair of fastq files processed by its own tasks
+    with open(samplesheet, newline="") as f:
+        rows = [row for row in csv.reader(f) if any(x.strip() for x in row)]
+
+    return max(len(rows) - 1, 1)
+
+
+def executor_config(samples: int) -> str:
+    # scale the number of running tasks with the cohort, and poll and submit less often for the large ones
+    # to spare the k8s API
+    queue_size = min(max(samples * 16, 64), 1024)
+    if queue_size <= 128:
+        poll_interval, rate = "5s", "20/1s"
+    elif queue_size <= 512:
+        poll_interval, rate = "10s", "15/1s"
+    else:
+        poll_interval, rate = "20s", "10/1s"
+
+    return "\n".join(
+        [
+            "executor {",
+            f"    queueSize = {queue_size}",
+            f"    submitRateLimit = '{rate}'",
+            f"    pollInterval = '{poll_interval}'",
+            f"    queueStatInterval = '{poll_interval}'",
+            "    dumpInterval = '5min'",
+            "}",
+            "",
+        ]
+    )
+
+
+def file_size(path: str) -> typing.Optional[int]:
+    # size in bytes of a file on latch, on the web or local, None if unknown
+    try:
+        if path.startswith("latch://"):
+            return LPath(path).size()
+        if path.startswith(("http://", "https://")):
+            resp = requests.head(path, allow_redirects=True, timeout=30)
+            resp.raise_for_status()
+            return int(resp.headers["Content-Length"])
+        return os.path.getsize(path)
+    except Exception as e:
+        print(f"Failed to get the size of {path}: {e}")
+        return None
+
+
+def estimate_storage(samplesheet: Path, interactions_tool: typing.Optional[str]) -> int:
+    # storage in GiB for the work directory, from the size of the fastq files of the samplesheet
+    with open(samplesheet, newline="") as f:
+        rows = list(csv.DictReader(f))
+    fastqs = [row[x].strip() for row in rows for x in ("fastq_1", "fastq_2") if row.get(x) and row[x].strip()]
+
+    fastq_gib = 0.0
+    unknown = 0
+    for fastq in fastqs:
+        size = file_size(fastq)
+        if size is None:
+            unknown += 1
+            fastq_gib += default_fastq_gib
+        else:
+            fastq_gib += size / (1 << 30)
+
+    factor = 1 + sum(expansion_factors.values())
+    if interactions_tool in (None, "maps"):
+        factor += maps_expansion_factor
+    # 20% headroom for the logs, the reports and the files not accounted for
+    storage = int((fastq_gib * factor + reference_gib) * 1.2) + 1
+    storage = min(max(storage, 50), 4096)
+
+    print(
+        f"{len(fastqs)} fastq files, {fastq_gib:.1f} GiB ({unknown} of unknown size counted as {default_fastq_gib} GiB)"
+    )
+    print(
+        f"Estimated storage: {fastq_gib:.1f} GiB x {factor:.1f} + {reference_gib} GiB of reference, +20%: {storage} GiB"
+    )
+
+    return storage
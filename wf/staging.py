@@ -0,0 +1,88 @@
+import hashlib
+import os
+import shutil
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# files and directories of the pipeline needed by nextflow at runtime, relative to the image root
+manifest = [
+    "main.nf",
+    "nextflow.config",
+    "latch.config",
+    "nextflow_schema.json",
+    "modules.json",
+    "assets",
+    "bin",
+    "conf",
+    "lib",
+    "modules",
+    "subworkflows",
+    "workflows",
+]
+
+ignore_names = {"__pycache__", ".DS_Store"}
+
+
+def list_files(root: Path) -> typing.List[Path]:
+    files = []
+    for entry in manifest:
+        path = root / entry
+        if path.is_file():
+            files.append(path)
+        elif path.is_dir():
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = [x for x in dirnames if x not in ignore_names]
+                files.extend(Path(dirpath) / x for x in filenames if x not in ignore_names)
+        else:
+            print(f"Staging: {path} is missing from the image, skipping")
+
+    return files
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.blake2b()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def stage_file(src: Path, dst: Path) -> str:
+    # copy src to dst unless dst already has the same content, return what was done
+    if src.is_symlink() and not src.exists():
+        return "skipped"
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        dst_stat = None
+
+    src_stat = src.stat()
+    if dst_stat is not None and dst_stat.st_size == src_stat.st_size:
+        if int(dst_stat.st_mtime) == int(src_stat.st_mtime):
+            return "unchanged"
+        # same size but touched, e.g. by an image rebuild: compare the content
+        if file_hash(src) == file_hash(dst):
+            shutil.copystat(src, dst)
+            return "unchanged"
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary name first, so an interrupted copy is never taken as staged
+    tmp = dst.with_name(f".{dst.name}.staging")
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+    return "copied"
+
+
+def stage_workflow(src: Path, dst: Path, workers: int = 16) -> None:
+    files = list_files(src)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda x: stage_file(x, dst / x.relative_to(src)), files))
+
+    counts = {x: results.count(x) for x in ("copied", "unchanged", "skipped")}
+    print(
+        f"Staged {len(files)} files to {dst}: "
+        f"{counts['copied']} copied, {counts['unchanged']} unchanged, {counts['skipped']} skipped"
+    )
@@ -0,0 +1,237 @@
+import argparse
+import csv
+import itertools
+import math
+import re
+import statistics
+import typing
+from collections import defaultdict
+from pathlib import Path
+
+# resources of the labels of conf/base.config at the first attempt: cpus, memory (GB), time (h)
+labels = {
+    "process_single": (1, 6, 4),
+    "process_low": (2, 12, 4),
+    "process_medium": (6, 36, 8),
+    "process_high": (12, 72, 16),
+}
+# resources of a process without label, and of the labels setting only some of them,
+# which override the resources of the labels above
+defaults = (1, 6, 4)
+modifiers = {
+    "process_long": (None, None, 48),
+    "process_high_memory": (None, 200, None),
+    "process_high_cpus": (16, None, None),
+}
+
+columns = [
+    "process",
+    "tasks",
+    "failed",
+    "retried",
+    "realtime_p50_min",
+    "realtime_p90_min",
+    "realtime_max_min",
+    "cpus_requested",
+    "cpus_used_p90",
+    "cpu_efficiency",
+    "memory_requested_gb",
+    "peak_rss_p90_gb",
+    "peak_rss_max_gb",
+    "memory_headroom",
+    "label",
+    "suggested_cpus",
+    "suggested_memory_gb",
+    "suggested_time_h",
+    "suggested_label",
+]
+
+duration_units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+memory_units = {"B": 1, "KB": 1 << 10, "MB": 1 << 20, "GB": 1 << 30, "TB": 1 << 40}
+
+
+def parse_duration(value: str) -> typing.Optional[float]:
+    # seconds from the raw (milliseconds) or formatted (e.g. 1h 2m 3s) duration of the trace
+    value = value.strip()
+    if value in ("", "-"):
+        return None
+    if re.fullmatch(r"[\d.]+", value):
+        return float(value) / 1000
+
+    return sum(float(x) * duration_units[unit] for x, unit in re.findall(r"([\d.]+)\s*(ms|s|m|h|d)", value))
+
+
+def parse_memory(value: str) -> typing.Optional[float]:
+    # bytes from the raw or formatted (e.g. 1.2 GB) memory of the trace
+    value = value.strip()
+    if value in ("", "-"):
+        return None
+    if re.fullmatch(r"[\d.]+", value):
+        return float(value)
+    match = re.fullmatch(r"([\d.]+)\s*([KMGT]?B)", value)
+
+    return float(match.group(1)) * memory_units[match.group(2)] if match else None
+
+
+def parse_number(value: str) -> typing.Optional[float]:
+    value = value.strip().rstrip("%")
+    if value in ("", "-"):
+        return None
+
+    return float(value)
+
+
+def percentile(values: typing.List[float], q: float) -> typing.Optional[float]:
+    # linear interpolation between the closest ranks
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * q / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(values) - 1)
+
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def read_trace(path: Path) -> typing.List[typing.Dict[str, str]]:
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f, delimiter="\t"))
+
+
+def process_name(record: typing.Dict[str, str]) -> str:
+    # the process field is missing from the default trace fields, the name is then PROCESS (tag)
+    if record.get("process"):
+        return record["process"].split(":")[-1]
+
+    return record.get("name", "").split(" (")[0].split(":")[-1]
+
+
+def label_combinations() -> typing.List[typing.Tuple[str, typing.Tuple[int, int, int]]]:
+    # (labels, resources) of a label or none with any of the modifiers, with the fewest modifiers first
+    combinations = []
+    for n in range(len(modifiers) + 1):
+        for names in itertools.combinations(modifiers, n):
+            for label, resources in [(None, defaults)] + list(labels.items()):
+                for name in names:
+                    resources = tuple(x if m is None else m for x, m in zip(resources, modifiers[name]))
+                combinations.append(("+".join(([label] if label else []) + list(names)), resources))
+
+    return combinations
+
+
+def match_label(cpus: float, memory_gb: float, time_h: typing.Optional[float] = None) -> str:
+    # labels of the requested resources, at the first attempt; without the time, the
+    # labels differing only by process_long can not be told apart
+    for label, (label_cpus, label_memory, label_time) in label_combinations():
+        if not label:
+            continue
+        if cpus == label_cpus and round(memory_gb) == label_memory and (time_h is None or round(time_h) == label_time):
+            return label
+
+    return "-"
+
+
+def smallest_label(cpus: int, memory_gb: int, time_h: int) -> str:
+    for label, (label_cpus, label_memory, label_time) in label_combinations():
+        if label and cpus <= label_cpus and memory_gb <= label_memory and time_h <= label_time:
+            return label
+
+    return "process_high+"
+
+
+def summarize(records: typing.List[typing.Dict[str, str]]) -> typing.List[typing.Dict[str, typing.Any]]:
+    groups = defaultdict(list)
+    for record in records:
+        groups[process_name(record)].append(record)
+
+    rows = []
+    for process, tasks in sorted(groups.items()):
+        # the cached tasks did not run, and have no usage
+        ran = [x for x in tasks if x.get("status") != "CACHED"]
+        if not ran:
+            continue
+        first = [x for x in ran if x.get("attempt", "1") == "1"] or ran
+        realtime = [x for x in (parse_duration(t.get("realtime", "-")) for t in ran) if x is not None]
+        cpus_used = [x / 100 for x in (parse_number(t.get("%cpu", "-")) for t in ran) if x is not None]
+        rss = [x / (1 << 30) for x in (parse_memory(t.get("peak_rss", "-")) for t in ran) if x is not None]
+        efficiency = [
+            used / 100 / cpus
+            for used, cpus in ((parse_number(t.get("%cpu", "-")), parse_number(t.get("cpus", "-"))) for t in ran)
+            if used is not None and cpus
+        ]
+        requested_cpus = [x for x in (parse_number(t.get("cpus", "-")) for t in first) if x is not None]
+        requested_memory = [x / (1 << 30) for x in (parse_memory(t.get("memory", "-")) for t in first) if x is not None]
+        requested_time = [x / 3600 for x in (parse_duration(t.get("time", "-")) for t in first) if x is not None]
+
+        cpus = statistics.median(requested_cpus) if requested_cpus else None
+        memory = statistics.median(requested_memory) if requested_memory else None
+        time_h = statistics.median(requested_time) if requested_time else None
+        cpus_p90 = percentile(cpus_used, 90)
+        rss_p90 = percentile(rss, 90)
+        rss_max = max(rss) if rss else None
+        realtime_max = max(realtime) if realtime else None
+
+        # the 90th percentile of the cpus used, the peak memory with 20% and the longest run with 50% to spare
+        suggested_cpus = max(1, math.ceil(cpus_p90)) if cpus_p90 is not None else None
+        suggested_memory = max(1, math.ceil(rss_max * 1.2)) if rss_max is not None else None
+        suggested_time = max(1, math.ceil(realtime_max * 1.5 / 3600)) if realtime_max is not None else None
+
+        rows.append(
+            {
+                "process": process,
+                "tasks": len(ran),
+                "failed": sum(x.get("status") == "FAILED" for x in ran),
+                "retried": sum(x.get("attempt", "1") != "1" for x in ran),
+                "realtime_p50_min": percentile(realtime, 50) / 60 if realtime else None,
+                "realtime_p90_min": percentile(realtime, 90) / 60 if realtime else None,
+                "realtime_max_min": realtime_max / 60 if realtime else None,
+                "cpus_requested": cpus,
+                "cpus_used_p90": cpus_p90,
+                "cpu_efficiency": statistics.mean(efficiency) if efficiency else None,
+                "memory_requested_gb": memory,
+                "peak_rss_p90_gb": rss_p90,
+                "peak_rss_max_gb": rss_max,
+                "memory_headroom": 1 - rss_max / memory if rss_max is not None and memory else None,
+                "label": match_label(cpus, memory, time_h) if cpus and memory else "-",
+                "suggested_cpus": suggested_cpus,
+                "suggested_memory_gb": suggested_memory,
+                "suggested_time_h": suggested_time,
+                "suggested_label": smallest_label(suggested_cpus, suggested_memory, suggested_time)
+                if None not in (suggested_cpus, suggested_memory, suggested_time)
+                else "-",
+            }
+        )
+
+    return rows
+
+
+def format_value(value: typing.Any) -> str:
+    if value is None:
+        return "NA"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+
+    return str(value)
+
+
+def write_report(rows: typing.List[typing.Dict[str, typing.Any]], prefix: str) -> Path:
+    # prefix.tsv, written once the run is over, so it is a plain table and not a MultiQC report
+    lines = ["\t".join(columns)]
+    lines.extend("\t".join(format_value(row[x]) for x in columns) for row in rows)
+    tsv = Path(prefix + ".tsv")
+    tsv.write_text("\n".join(lines) + "\n")
+
+    return tsv
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the resource usage of every process of a nextflow trace")
+    parser.add_argument("trace", help="nextflow trace file")
+    parser.add_argument("-o", "--prefix", default="process_resources", help="prefix of the output files")
+    args = parser.parse_args()
+
+    write_report(summarize(read_trace(Path(args.trace))), args.prefix)
+
+
+if __name__ == "__main__":
+    main()
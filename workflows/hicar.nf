@@ -21,17 +21,8 @@ if (params.input) {
 } else { exit 1, 'Input samplesheet not specified!' }
 
 // set the restriction_sites
-def RE_cutsite = [
-    "mboi": "^GATC",
-    "dpnii": "^GATC",
-    "bglii": "^GATCT",
-    "hindiii": "^AGCTT",
-    "cviqi": "^TAC",
-    "msei":"^TAA"]
-if (!params.enzyme.toLowerCase() in RE_cutsite){
-    exit 1, "Not supported yet!"
-}
-params.restriction_sites = RE_cutsite[params.enzyme.toLowerCase()]
+def RE_cutsite = WorkflowHicar.restrictionEnzyme(params.enzyme, "${projectDir}/assets/restriction_enzymes.tsv")
+params.restriction_sites = RE_cutsite.restriction_sites
 
 // if user defined Peaks
 ch_anchor_peaks = Channel.empty()
@@ -312,7 +303,10 @@ workflow HICAR {
     // prepare for MAPS
     //
     if(params.interactions_tool == 'maps'){
+        // the index of the chromosome pairs is staged with the bedpe files, MAPS skips the absent pairs
         ch_loop_matrix = COOLER.out.bedpe
+                            .join(COOLER.out.bedpe_index)
+                            .map{ meta, bedpe, index -> [meta, [bedpe, index].flatten()] }
         ch_loop_1d_peak = ATAC_PEAK.out.reads.combine(ATAC_PEAK.out.mergedpeak)
         ch_loop_additional = PREPARE_GENOME.out.site
                                 .combine(PREPARE_GENOME.out.fasta)